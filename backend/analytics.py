@@ -0,0 +1,100 @@
+"""
+Per-user performance rollups.
+
+Each graded exam adds its per-question results to small counter documents in user_rollups, one
+per (user, period, dimension, key): the lifetime period ("all") and the UTC day of completion,
+for the overall, per-category and per-difficulty dimensions. Analytics reads are then a single
+indexed query over those documents instead of an aggregation over exam_sessions.
+
+Each document remembers the last few sessions it counted, so replaying a completion after a partial
+failure does not count the exam twice.
+"""
+
+from typing import Any, Dict, Iterable, List
+
+from pymongo import UpdateOne
+
+LIFETIME_PERIOD = "all"
+OVERALL_KEY = "all"
+# Recent session ids kept per rollup document to make completion replays idempotent
+ROLLUP_SESSION_HISTORY = 20
+
+
+def rollup_updates(
+    user_id: str,
+    session_id: str,
+    day: str,
+    score: float,
+    category_deltas: Dict[str, List[int]],
+    difficulty_deltas: Dict[str, List[int]],
+) -> List[UpdateOne]:
+    """
+    Upserts adding one exam to the user's rollups; deltas map key -> [questions, correct].
+
+    An update whose document already counted session_id matches nothing, and its upsert then fails
+    with a duplicate key error on the unique rollup index; callers treat that as already applied.
+    """
+    questions = sum(delta[0] for delta in category_deltas.values())
+    correct = sum(delta[1] for delta in category_deltas.values())
+    counters = [("overall", OVERALL_KEY, {"exams": 1, "questions": questions, "correct": correct, "total_score": score})]
+    for dimension, deltas in (("category", category_deltas), ("difficulty", difficulty_deltas)):
+        for key, (key_questions, key_correct) in deltas.items():
+            counters.append((dimension, key, {"exams": 1, "questions": key_questions, "correct": key_correct}))
+
+    return [
+        UpdateOne(
+            {"user_id": user_id, "period": period, "dimension": dimension, "key": key, "sessions": {"$ne": session_id}},
+            {"$inc": increments, "$push": {"sessions": {"$each": [session_id], "$slice": -ROLLUP_SESSION_HISTORY}}},
+            upsert=True
+        )
+        for period in (LIFETIME_PERIOD, day)
+        for dimension, key, increments in counters
+    ]
+
+
+def _summary(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    questions = rollup.get("questions", 0)
+    summary = {
+        "exams": rollup.get("exams", 0),
+        "questions": questions,
+        "correct": rollup.get("correct", 0),
+        "accuracy": rollup.get("correct", 0) / questions * 100 if questions else 0.0,
+    }
+    if "total_score" in rollup:
+        summary["average_score"] = rollup["total_score"] / summary["exams"] if summary["exams"] else 0.0
+    return summary
+
+
+def build_analytics(rollups: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Shape lifetime and daily rollup documents into the analytics response"""
+    analytics: Dict[str, Any] = {
+        "overall": _summary({"total_score": 0.0}),
+        "categories": [],
+        "difficulties": [],
+        "daily": [],
+    }
+    daily: Dict[str, Dict[str, Any]] = {}
+    for rollup in rollups:
+        summary = _summary(rollup)
+        dimension = rollup["dimension"]
+        if rollup["period"] == LIFETIME_PERIOD:
+            if dimension == "overall":
+                analytics["overall"] = summary
+            else:
+                analytics["categories" if dimension == "category" else "difficulties"].append({dimension: rollup["key"], **summary})
+            continue
+
+        day = daily.setdefault(
+            rollup["period"],
+            {"date": rollup["period"], **_summary({"total_score": 0.0}), "categories": [], "difficulties": []}
+        )
+        if dimension == "overall":
+            day.update(summary)
+        else:
+            day["categories" if dimension == "category" else "difficulties"].append({dimension: rollup["key"], **summary})
+
+    analytics["daily"] = [daily[date] for date in sorted(daily)]
+    for breakdown in [analytics] + analytics["daily"]:
+        breakdown["categories"].sort(key=lambda entry: entry["category"])
+        breakdown["difficulties"].sort(key=lambda entry: entry["difficulty"])
+    return analytics
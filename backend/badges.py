@@ -0,0 +1,116 @@
+"""
+Declarative badge rules.
+
+Rules are evaluated in memory against a user_stats document: the post-image returned by the
+exam-completion update on the submit path, or documents streamed by the badge backfill job.
+Adding a badge means registering a rule; the backfill awards it to users who already qualify.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+
+class BadgeRule(ABC):
+    def __init__(self, badge_id: str, name: str, description: str):
+        self.badge_id = badge_id
+        self.name = name
+        self.description = description
+
+    @abstractmethod
+    def evaluate(self, stats: Dict[str, Any]) -> bool:
+        """Whether the stats document qualifies for the badge"""
+
+    def dict(self) -> Dict[str, Any]:
+        return {"id": self.badge_id, "name": self.name, "description": self.description}
+
+
+class CountRule(BadgeRule):
+    """A counter on the stats document (e.g. total_exams) reached a minimum"""
+
+    def __init__(self, badge_id: str, name: str, description: str, field: str, minimum: int):
+        super().__init__(badge_id, name, description)
+        self.field = field
+        self.minimum = minimum
+
+    def evaluate(self, stats: Dict[str, Any]) -> bool:
+        return (stats.get(self.field) or 0) >= self.minimum
+
+
+class AverageScoreRule(BadgeRule):
+    """Lifetime average score strictly above a threshold, once enough exams are taken"""
+
+    def __init__(self, badge_id: str, name: str, description: str, above: float, min_exams: int = 1):
+        super().__init__(badge_id, name, description)
+        self.above = above
+        self.min_exams = min_exams
+
+    def evaluate(self, stats: Dict[str, Any]) -> bool:
+        return (stats.get("total_exams") or 0) >= self.min_exams and (stats.get("average_score") or 0) > self.above
+
+
+class StreakRule(BadgeRule):
+    """Exams completed on this many consecutive (UTC) days at some point"""
+
+    def __init__(self, badge_id: str, name: str, description: str, days: int):
+        super().__init__(badge_id, name, description)
+        self.days = days
+
+    def evaluate(self, stats: Dict[str, Any]) -> bool:
+        return (stats.get("longest_streak") or 0) >= self.days
+
+
+class CategoryAccuracyRule(BadgeRule):
+    """Accuracy (percent) in one category, or in any category when category is None"""
+
+    def __init__(
+        self,
+        badge_id: str,
+        name: str,
+        description: str,
+        min_accuracy: float,
+        min_questions: int,
+        category: Optional[str] = None,
+    ):
+        super().__init__(badge_id, name, description)
+        self.min_accuracy = min_accuracy
+        self.min_questions = min_questions
+        self.category = category
+
+    def evaluate(self, stats: Dict[str, Any]) -> bool:
+        for entry in stats.get("categories") or []:
+            if self.category is not None and entry["category"] != self.category:
+                continue
+            questions = entry.get("questions") or 0
+            if questions >= self.min_questions and entry.get("correct", 0) / questions * 100 >= self.min_accuracy:
+                return True
+        return False
+
+
+BADGE_RULES: List[BadgeRule] = [
+    CountRule("first_exam", "First Exam", "Complete your first exam", "total_exams", 1),
+    CountRule("ten_exams", "Ten Exams", "Complete 10 exams", "total_exams", 10),
+    CountRule("fifty_exams", "Fifty Exams", "Complete 50 exams", "total_exams", 50),
+    AverageScoreRule("high_scorer", "High Scorer", "Keep an average score above 80%", above=80),
+    StreakRule("three_day_streak", "On a Roll", "Complete exams on 3 consecutive days", days=3),
+    StreakRule("seven_day_streak", "Week Streak", "Complete exams on 7 consecutive days", days=7),
+    CategoryAccuracyRule(
+        "category_expert", "Category Expert", "Answer 90% of at least 20 questions in a category correctly",
+        min_accuracy=90, min_questions=20
+    ),
+]
+
+
+def register_badge_rule(rule: BadgeRule):
+    if any(existing.badge_id == rule.badge_id for existing in BADGE_RULES):
+        raise ValueError(f"Badge rule {rule.badge_id} is already registered")
+    BADGE_RULES.append(rule)
+
+
+def badge_ids() -> List[str]:
+    return [rule.badge_id for rule in BADGE_RULES]
+
+
+def evaluate_badges(stats: Dict[str, Any]) -> List[str]:
+    """Ids of badges whose rules the stats satisfy and that the user does not hold yet"""
+    held = set(stats.get("badges") or [])
+    return [rule.badge_id for rule in BADGE_RULES if rule.badge_id not in held and rule.evaluate(stats)]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Grading benchmark: the previous per-question Python loop in submit_exam vs grading.grade_session
+for long exams, and vs grading.grade_sessions (the path the regrade job runs) for bulk re-grading.
+EncodedSessions is timed separately: encoding once and re-grading against corrected keys.
+
+Usage (from backend/):
+    python benchmarks/bench_grading.py [--questions 200] [--sessions 10000]
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from grading import AnswerKey, EncodedSessions, grade_session, grade_sessions  # noqa: E402
+
+
+def legacy_grade(question_ids, answers, question_dict):
+    """Scoring part of the loop previously inlined in submit_exam"""
+    correct_answers = 0
+    for question_id in question_ids:
+        if answers.get(question_id) == question_dict[question_id]["correct_answer"]:
+            correct_answers += 1
+    return correct_answers, (correct_answers / len(question_ids)) * 100
+
+
+def make_data(num_bank: int, num_questions: int, num_sessions: int, seed: int = 7):
+    rng = random.Random(seed)
+    bank = {str(uuid.uuid4()): {"correct_answer": rng.randrange(4)} for _ in range(num_bank)}
+    bank_ids = list(bank)
+    sessions = []
+    for _ in range(num_sessions):
+        question_ids = rng.sample(bank_ids, num_questions)
+        answers = {qid: rng.randrange(4) for qid in question_ids if rng.random() < 0.9}
+        sessions.append({"id": str(uuid.uuid4()), "questions": question_ids, "answers": answers})
+    return bank, sessions
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bank", type=int, default=5000, help="questions in the bank")
+    parser.add_argument("--questions", type=int, default=200, help="questions per session")
+    parser.add_argument("--sessions", type=int, default=10000, help="sessions in the bulk re-grade")
+    args = parser.parse_args()
+
+    bank, sessions = make_data(args.bank, args.questions, args.sessions)
+    correct_answers = {qid: q["correct_answer"] for qid, q in bank.items()}
+    answer_key = AnswerKey(correct_answers)
+
+    # Correctness: every grader must agree with the legacy loop
+    batch = grade_sessions(sessions, answer_key)
+    for i, session in enumerate(sessions):
+        expected_correct, expected_score = legacy_grade(session["questions"], session["answers"], bank)
+        single = grade_session(session["questions"], session["answers"], correct_answers)
+        assert single.correct_answers == expected_correct == batch.correct_answers[i]
+        assert single.score == expected_score == batch.scores[i]
+
+    session = sessions[0]
+    print(f"single session, {args.questions} questions")
+    legacy_single, _ = timed(lambda: legacy_grade(session["questions"], session["answers"], bank), 2000)
+    fast_single, _ = timed(lambda: grade_session(session["questions"], session["answers"], correct_answers), 2000)
+    print(f"  legacy loop       {legacy_single * 1e6:10.1f} us")
+    print(f"  grade_session     {fast_single * 1e6:10.1f} us")
+
+    print(f"bulk re-grade, {args.sessions} sessions x {args.questions} questions")
+    legacy_bulk, _ = timed(lambda: [legacy_grade(s["questions"], s["answers"], bank) for s in sessions], 5)
+    fast_bulk, _ = timed(lambda: grade_sessions(sessions, answer_key), 5)
+    print(f"  legacy loop                 {legacy_bulk * 1e3:10.1f} ms")
+    print(f"  grade_sessions              {fast_bulk * 1e3:10.1f} ms  ({legacy_bulk / fast_bulk:.1f}x, regrade job)")
+
+    encode, encoded = timed(lambda: EncodedSessions(sessions, answer_key))
+    corrected_qid = sessions[0]["questions"][0]
+    answer_key.set(corrected_qid, (correct_answers[corrected_qid] + 1) % 4)
+    regrade, _ = timed(lambda: encoded.grade(answer_key), 20)
+    print(f"  EncodedSessions (encode)    {encode * 1e3:10.1f} ms")
+    print(f"  EncodedSessions.grade       {regrade * 1e3:10.1f} ms  (each further re-grade of the encoded sessions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Serialization micro-benchmark: legacy serialize_doc + JSON encoding vs MongoJSONResponse
+on a 50-session exam history payload.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--iterations 2000]
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from server import MongoJSONResponse  # noqa: E402
+
+
+def legacy_serialize_doc(doc):
+    """The recursive serializer previously used by the history/profile routes"""
+    if doc is None:
+        return None
+    if isinstance(doc, list):
+        return [legacy_serialize_doc(item) for item in doc]
+    if isinstance(doc, dict):
+        serialized = {}
+        for key, value in doc.items():
+            if isinstance(value, ObjectId):
+                serialized[key] = str(value)
+            elif isinstance(value, datetime):
+                serialized[key] = value.isoformat()
+            elif isinstance(value, (dict, list)):
+                serialized[key] = legacy_serialize_doc(value)
+            else:
+                serialized[key] = value
+        return serialized
+    return doc
+
+
+def make_history(num_sessions: int = 50, num_questions: int = 10, with_object_id: bool = True):
+    sessions = []
+    now = datetime.utcnow()
+    for i in range(num_sessions):
+        question_ids = [str(uuid.uuid4()) for _ in range(num_questions)]
+        session = {
+            "id": str(uuid.uuid4()),
+            "user_id": str(uuid.uuid4()),
+            "questions": question_ids,
+            "answers": {qid: i % 4 for qid in question_ids},
+            "score": 70.0,
+            "status": "completed",
+            "started_at": now - timedelta(minutes=30 + i),
+            "completed_at": now - timedelta(minutes=i),
+            "time_limit": 30,
+        }
+        if with_object_id:
+            session["_id"] = ObjectId()
+        sessions.append(session)
+    return sessions
+
+
+def bench(label, func, iterations):
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed / iterations * 1e6:10.1f} us/op")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=50)
+    args = parser.parse_args()
+
+    history = make_history(args.sessions)
+    projected = make_history(args.sessions, with_object_id=False)
+    response = MongoJSONResponse(content=None)
+
+    print(f"{args.sessions}-session history, {args.iterations} iterations")
+    legacy = bench(
+        "serialize_doc + json.dumps",
+        lambda: json.dumps(legacy_serialize_doc(history)).encode(),
+        args.iterations,
+    )
+    bench(
+        "serialize_doc + jsonable_encoder + json.dumps",
+        lambda: json.dumps(jsonable_encoder(legacy_serialize_doc(history))).encode(),
+        args.iterations,
+    )
+    fast = bench(
+        "MongoJSONResponse.render (projected, no _id)",
+        lambda: response.render(projected),
+        args.iterations,
+    )
+    bench(
+        "MongoJSONResponse.render (with ObjectId)",
+        lambda: response.render(history),
+        args.iterations,
+    )
+    print(f"speedup vs serialize_doc + json.dumps: {legacy / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Local load generator for the exam API.
+
+Simulates N concurrent students doing register -> start -> answer -> submit -> history -> leaderboard
+against a local uvicorn instance and writes p50/p95/p99 latency and throughput per endpoint to JSON.
+
+Usage (from backend/):
+    # Start uvicorn + a throwaway mongod (requires the `mongod` binary on PATH)
+    python benchmarks/load_test.py --students 200 --concurrency 50
+
+    # No MongoDB available: serve the app against an in-memory mongomock-motor stand-in
+    # (pip install mongomock-motor; numbers are only comparable between runs of the same mode)
+    python benchmarks/load_test.py --mongo mock --students 100
+
+    # Target a server that is already running
+    python benchmarks/load_test.py --base-url http://localhost:8001 --students 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        self.latencies[label].append((time.perf_counter() - start) * 1000)
+        self.statuses[label][response.status_code] += 1
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        return response
+
+    def report(self, wall_seconds: float) -> Dict[str, Dict]:
+        endpoints = {}
+        total_requests = 0
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            total_requests += len(values)
+            endpoints[label] = {
+                "count": len(values),
+                "errors": self.errors.get(label, 0),
+                "status_codes": dict(self.statuses[label]),
+                "throughput_rps": len(values) / wall_seconds if wall_seconds else 0.0,
+                "mean_ms": sum(values) / len(values),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+                "max_ms": values[-1],
+            }
+        return {
+            "wall_seconds": wall_seconds,
+            "total_requests": total_requests,
+            "throughput_rps": total_requests / wall_seconds if wall_seconds else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+async def simulate_student(client: httpx.AsyncClient, recorder: LatencyRecorder, args, run_id: str, index: int):
+    username = f"load_{run_id}_{index}"
+    response = await recorder.request(
+        client, "POST /auth/register", "POST", "/api/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": "LoadTest123!"},
+    )
+    if response is None or response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = await recorder.request(
+        client, "POST /exam/start", "POST", "/api/exam/start",
+        params={"num_questions": args.questions}, headers=headers,
+    )
+    if response is None or response.status_code != 200:
+        return
+    exam = response.json()
+    session_id = exam["session_id"]
+
+    if args.batch_answers:
+        answers = [{"question_id": q["id"], "selected_option": index % len(q["options"])} for q in exam["questions"]]
+        await recorder.request(
+            client, "POST /exam/{id}/answers", "POST", f"/api/exam/{session_id}/answers",
+            json={"answers": answers}, headers=headers,
+        )
+    else:
+        for question in exam["questions"]:
+            await recorder.request(
+                client, "POST /exam/{id}/answer", "POST", f"/api/exam/{session_id}/answer",
+                params={"question_id": question["id"], "selected_option": index % len(question["options"])},
+                headers=headers,
+            )
+
+    await recorder.request(client, "POST /exam/{id}/submit", "POST", f"/api/exam/{session_id}/submit", headers=headers)
+    await recorder.request(client, "GET /exam/history", "GET", "/api/exam/history", headers=headers)
+    await recorder.request(client, "GET /leaderboard", "GET", "/api/leaderboard", headers=headers)
+
+
+async def run_load(base_url: str, args) -> Dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        await client.post("/api/admin/init")
+        recorder = LatencyRecorder()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        run_id = uuid.uuid4().hex[:8]
+
+        async def student(index: int):
+            async with semaphore:
+                await simulate_student(client, recorder, args, run_id, index)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(student(i) for i in range(args.students)))
+        wall_seconds = time.perf_counter() - start
+
+    report = recorder.report(wall_seconds)
+    report["config"] = {
+        "students": args.students,
+        "concurrency": args.concurrency,
+        "questions": args.questions,
+        "batch_answers": args.batch_answers,
+        "base_url": base_url,
+    }
+    return report
+
+
+def wait_for_server(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server process exited during startup")
+        try:
+            httpx.get(f"{base_url}/docs", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+
+def start_mongod(workdir: str) -> tuple:
+    mongod = shutil.which("mongod")
+    if not mongod:
+        raise RuntimeError("mongod not found on PATH; install MongoDB or use --mongo mock")
+    port = free_port()
+    dbpath = os.path.join(workdir, "db")
+    os.makedirs(dbpath)
+    process = subprocess.Popen(
+        [mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, f"mongodb://127.0.0.1:{port}"
+
+
+def start_server(args, workdir: str) -> tuple:
+    """Start uvicorn (and mongod when needed) in child processes; returns (base_url, processes)"""
+    processes = []
+    port = free_port()
+    env = dict(os.environ, DB_NAME=f"load_test_{uuid.uuid4().hex[:8]}")
+    if args.mongo == "mongod":
+        mongod_process, env["MONGO_URL"] = start_mongod(workdir)
+        processes.append(mongod_process)
+        command = [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"]
+        if args.workers > 1:
+            command += ["--workers", str(args.workers)]
+    else:
+        command = [sys.executable, str(Path(__file__).resolve()), "--serve-mock", "--port", str(port)]
+    processes.append(subprocess.Popen(command, cwd=BACKEND_DIR, env=env))
+    base_url = f"http://127.0.0.1:{port}"
+    wait_for_server(base_url, processes[-1])
+    return base_url, processes
+
+
+def serve_mock(port: int):
+    """Serve the app against an in-memory mongomock-motor database (development stand-in only)"""
+    from mongomock import collection as mongomock_collection
+    from mongomock_motor import AsyncMongoMockClient
+    import uvicorn
+
+    # mongomock re-reads find_one_and_update post-images with the original filter unless the
+    # projection keeps _id, so always fetch _id and strip it again when the caller excluded it
+    find_and_modify = mongomock_collection.Collection._find_and_modify
+
+    def find_and_modify_keeping_id(self, query, projection=None, *fargs, **fkwargs):
+        if not projection or projection.get("_id", 1):
+            return find_and_modify(self, query, projection, *fargs, **fkwargs)
+        # Dropping the _id exclusion keeps _id in both inclusion and exclusion projections
+        projection = {field: value for field, value in projection.items() if field != "_id"} or None
+        document = find_and_modify(self, query, projection, *fargs, **fkwargs)
+        if document is not None:
+            document.pop("_id", None)
+        return document
+
+    mongomock_collection.Collection._find_and_modify = find_and_modify_keeping_id
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    server.client = AsyncMongoMockClient()
+    server.db = server.client[os.environ.get("DB_NAME", "load_test")]
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def print_report(report: Dict):
+    print(f"{report['total_requests']} requests in {report['wall_seconds']:.2f}s ({report['throughput_rps']:.1f} req/s)")
+    print(f"{'endpoint':<28}{'count':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, stats in report["endpoints"].items():
+        print(
+            f"{label:<28}{stats['count']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9.1f}"
+            f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=50, help="number of simulated students")
+    parser.add_argument("--concurrency", type=int, default=20, help="students in flight at once")
+    parser.add_argument("--questions", type=int, default=5, help="questions per exam")
+    parser.add_argument("--batch-answers", action="store_true", help="flush answers through /answers in one call")
+    parser.add_argument("--base-url", help="target an already running server instead of starting one")
+    parser.add_argument("--mongo", choices=["mongod", "mock"], default="mongod", help="database for the local server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (mongod mode only)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", default="load_test_results.json", help="JSON report path")
+    parser.add_argument("--serve-mock", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_mock:
+        serve_mock(args.port)
+        return
+
+    processes = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            base_url = args.base_url
+            if not base_url:
+                base_url, processes = start_server(args, workdir)
+            report = asyncio.run(run_load(base_url, args))
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait(timeout=10)
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print_report(report)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
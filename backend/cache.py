@@ -0,0 +1,218 @@
+"""
+Process-local cache tier and cross-worker invalidation.
+
+LRUCache is the in-process tier: a bounded LRU map with an optional TTL. An InvalidationBus fans
+out "these keys changed" messages on named channels to subscribed handlers. The base bus only
+reaches the current process. MongoInvalidationBus also writes each message to a capped
+collection that every worker tails, so a write handled by one uvicorn worker evicts stale
+entries in all of them, typically within one round trip. A handler receives the changed keys,
+or None when the whole channel must be dropped (e.g. after the tail lost its position).
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Bounded LRU map; entries expire after ttl_seconds when a TTL is given"""
+
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        if self.max_size <= 0 or (self.ttl_seconds is not None and self.ttl_seconds <= 0):
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def invalidate_many(self, keys: Optional[List[str]]):
+        """Drop the given keys, or everything when keys is None"""
+        if keys is None:
+            self.clear()
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+Handler = Callable[[Optional[List[str]]], Any]
+
+
+class InvalidationBus:
+    """Delivers invalidations to handlers in this process only (single-worker deployments)"""
+
+    shared = False
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        """handler(keys) may be a plain function or a coroutine function"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, keys: Optional[List[str]] = None):
+        self.published += 1
+        await self._dispatch(channel, keys)
+
+    async def _dispatch(self, channel: str, keys: Optional[List[str]]):
+        for handler in self._handlers.get(channel, []):
+            try:
+                result = handler(keys)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Cache invalidation handler for {channel} failed: {str(e)}")
+
+    async def _dispatch_all(self):
+        for channel in list(self._handlers):
+            await self._dispatch(channel, None)
+
+    async def start(self, db, listen: bool = True):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": "local",
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+class MongoInvalidationBus(InvalidationBus):
+    """
+    Shares invalidations between processes through a capped collection tailed by every worker.
+
+    Works on standalone servers as well as replica sets (no change streams needed). Messages
+    from this process are applied locally on publish and skipped by its own tail.
+    """
+
+    shared = True
+
+    def __init__(self, collection_name: str = "cache_invalidations", size_bytes: int = 4 * 1024 * 1024,
+                 poll_interval_seconds: float = 0.5):
+        super().__init__()
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.poll_interval_seconds = poll_interval_seconds
+        self.origin = uuid.uuid4().hex
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db, listen: bool = True):
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        self._collection = db[self.collection_name]
+        if listen:
+            latest = await self._collection.find({}, {"_id": 1}).sort("$natural", -1).limit(1).to_list(1)
+            self._task = asyncio.create_task(self._listen(latest[0]["_id"] if latest else None))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def publish(self, channel: str, keys: Optional[List[str]] = None):
+        await super().publish(channel, keys)
+        if self._collection is not None:
+            await self._collection.insert_one(
+                {"channel": channel, "keys": keys, "origin": self.origin, "created_at": datetime.utcnow()}
+            )
+
+    async def _listen(self, last_id):
+        """Tail the collection in natural (insertion) order, resuming after last_id on every reconnect"""
+        while True:
+            try:
+                # ObjectIds from different processes are not ordered, so skip by position instead of
+                # filtering on _id; the capped collection is small enough to rescan
+                seen_last = last_id is None
+                cursor = self._collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                async for message in cursor:
+                    if not seen_last:
+                        seen_last = message["_id"] == last_id
+                        continue
+                    last_id = message["_id"]
+                    if message.get("origin") != self.origin:
+                        self.received += 1
+                        await self._dispatch(message["channel"], message.get("keys"))
+                if not seen_last:
+                    # Our position rolled out of the capped collection: messages were missed
+                    logger.warning("Cache invalidation tail lost its position; clearing local caches")
+                    await self._dispatch_all()
+                    last_id = None
+                # A tailable cursor dies on an empty collection; poll again shortly
+                await asyncio.sleep(self.poll_interval_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache invalidation tail failed, clearing local caches: {str(e)}")
+                await self._dispatch_all()
+                await asyncio.sleep(self.poll_interval_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["type"] = "mongo"
+        stats["listening"] = self._task is not None and not self._task.done()
+        return stats
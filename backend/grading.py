@@ -0,0 +1,194 @@
+"""
+Exam grading for the live submit path and for bulk re-grading.
+
+grade_session serves the live submit path and grade_sessions the regrade job (through
+regrade_sessions_containing); both count with plain comprehensions, because converting answers
+to arrays costs more than it saves when every session is graded once. EncodedSessions flattens
+sessions into parallel NumPy arrays (answer-key column, selected option) for the case where the
+same sessions are re-graded against several keys, where only the first grade pays for encoding.
+"""
+
+from typing import Any, AsyncIterator, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+# Sentinel for "no answer"; option indexes are never negative so it never matches the key
+UNANSWERED = -1
+
+
+class SessionGrade(NamedTuple):
+    correct_answers: int
+    total_questions: int
+    score: float
+    is_correct: List[bool]
+
+
+class BatchGrade(NamedTuple):
+    session_ids: List[str]
+    correct_answers: np.ndarray
+    total_questions: np.ndarray
+    scores: np.ndarray
+
+
+class AnswerKey:
+    """Dense answer key mapping question ids to columns of a correct-option array"""
+
+    def __init__(self, correct_answers: Optional[Dict[str, int]] = None):
+        self.index: Dict[str, int] = {}
+        self.answers: Dict[str, int] = {}
+        self._correct: List[int] = []
+        self._array: Optional[np.ndarray] = None
+        for question_id, correct_answer in (correct_answers or {}).items():
+            self.set(question_id, correct_answer)
+
+    def set(self, question_id: str, correct_answer: int):
+        column = self.index.get(question_id)
+        if column is None:
+            self.index[question_id] = len(self._correct)
+            self._correct.append(correct_answer)
+        else:
+            self._correct[column] = correct_answer
+        self.answers[question_id] = correct_answer
+        self._array = None
+
+    def __contains__(self, question_id: str) -> bool:
+        return question_id in self.index
+
+    @property
+    def correct(self) -> np.ndarray:
+        if self._array is None:
+            self._array = np.asarray(self._correct, dtype=np.int64)
+        return self._array
+
+
+def _score(correct_answers: np.ndarray, total_questions: np.ndarray) -> np.ndarray:
+    # Same operation order as the live path so re-grading reproduces stored scores bit for bit
+    fraction = np.divide(
+        correct_answers,
+        total_questions,
+        out=np.zeros(total_questions.shape, dtype=np.float64),
+        where=total_questions > 0,
+    )
+    return fraction * 100
+
+
+def grade_session(question_ids: List[str], answers: Dict[str, Any], correct_answers: Dict[str, int]) -> SessionGrade:
+    """
+    Grade one session; correct_answers maps every question id in the session to its key.
+
+    A single session is too small for array conversion to pay off (see benchmarks/bench_grading.py),
+    so this stays a comprehension.
+    """
+    get = answers.get
+    is_correct = [get(qid, UNANSWERED) == correct_answers[qid] for qid in question_ids]
+    total_questions = len(question_ids)
+    correct_count = sum(is_correct)
+    score = (correct_count / total_questions) * 100 if total_questions else 0.0
+    return SessionGrade(correct_count, total_questions, score, is_correct)
+
+
+class EncodedSessions:
+    """
+    Sessions flattened once into (answer-key column, selected option) arrays.
+
+    Re-grading the same sessions against a corrected AnswerKey is then purely vectorized;
+    new questions must not be added to the key after encoding.
+    """
+
+    def __init__(self, sessions: Iterable[Dict[str, Any]], answer_key: AnswerKey):
+        self.session_ids = []
+        lengths = []
+        columns = []
+        selected = []
+        index = answer_key.index
+        for session in sessions:
+            question_ids = session["questions"]
+            get = (session.get("answers") or {}).get
+            self.session_ids.append(session["id"])
+            lengths.append(len(question_ids))
+            columns += [index[qid] for qid in question_ids]
+            selected += [get(qid, UNANSWERED) for qid in question_ids]
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.columns = np.array(columns, dtype=np.int64)
+        self.selected = np.array(selected, dtype=np.int64)
+
+    def grade(self, answer_key: AnswerKey) -> BatchGrade:
+        if not self.session_ids:
+            empty = np.zeros(0, dtype=np.int64)
+            return BatchGrade([], empty, empty, np.zeros(0, dtype=np.float64))
+        return _grade_encoded(self.session_ids, self.lengths, answer_key.correct[self.columns] == self.selected)
+
+
+def _grade_encoded(session_ids: List[str], lengths: np.ndarray, is_correct: np.ndarray) -> BatchGrade:
+    # Segment sums over each session's slice of the flattened arrays
+    cumulative = np.concatenate(([0], np.cumsum(is_correct, dtype=np.int64)))
+    ends = np.cumsum(lengths)
+    correct_counts = cumulative[ends] - cumulative[ends - lengths]
+    return BatchGrade(session_ids, correct_counts, lengths, _score(correct_counts, lengths))
+
+
+def grade_sessions(sessions: Iterable[Dict[str, Any]], answer_key: AnswerKey) -> BatchGrade:
+    """
+    Grade many sessions at once; each session needs `id`, `questions` and `answers`.
+
+    Counts per session like grade_session and only scores the batch as arrays; this is about 1.2x
+    faster than the previous per-question loop, while encoding for EncodedSessions costs about twice
+    as much as either when each session is graded once (see benchmarks/bench_grading.py).
+    """
+    correct = answer_key.answers
+    session_ids = []
+    lengths = []
+    correct_counts = []
+    for session in sessions:
+        question_ids = session["questions"]
+        get = (session.get("answers") or {}).get
+        session_ids.append(session["id"])
+        lengths.append(len(question_ids))
+        correct_counts.append(sum([get(qid, UNANSWERED) == correct[qid] for qid in question_ids]))
+    lengths_array = np.array(lengths, dtype=np.int64)
+    correct_array = np.array(correct_counts, dtype=np.int64)
+    return BatchGrade(session_ids, correct_array, lengths_array, _score(correct_array, lengths_array))
+
+
+async def regrade_sessions_containing(
+    db,
+    question_ids: List[str],
+    batch_size: int = 1000,
+    query: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[tuple]:
+    """
+    Stream graded sessions that contain any of question_ids, batch_size at a time.
+
+    Yields (sessions, BatchGrade) per batch, where sessions carry id, user_id, score and
+    completed_at. The answer key is loaded lazily for every question the batch touches.
+    """
+    answer_key = AnswerKey()
+    filter_query = {"questions": {"$in": question_ids}, "status": "completed"}
+    filter_query.update(query or {})
+    cursor = db.exam_sessions.find(
+        filter_query,
+        {"_id": 0, "id": 1, "user_id": 1, "questions": 1, "answers": 1, "score": 1, "completed_at": 1},
+        batch_size=batch_size,
+    ).sort("id", 1)
+
+    batch = []
+    async for session in cursor:
+        batch.append(session)
+        if len(batch) >= batch_size:
+            await _load_answer_key(db, answer_key, batch)
+            yield batch, grade_sessions(batch, answer_key)
+            batch = []
+    if batch:
+        await _load_answer_key(db, answer_key, batch)
+        yield batch, grade_sessions(batch, answer_key)
+
+
+async def _load_answer_key(db, answer_key: AnswerKey, sessions: List[Dict[str, Any]]):
+    missing = {qid for session in sessions for qid in session["questions"] if qid not in answer_key}
+    if not missing:
+        return
+    async for question in db.questions.find({"id": {"$in": list(missing)}}, {"_id": 0, "id": 1, "correct_answer": 1}):
+        answer_key.set(question["id"], question["correct_answer"])
+    # Deleted questions can no longer be answered correctly
+    for question_id in missing - set(answer_key.index):
+        answer_key.set(question_id, UNANSWERED - 1)
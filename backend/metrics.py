@@ -0,0 +1,306 @@
+"""
+Request latency and MongoDB command instrumentation, exposed in Prometheus text format.
+
+MetricsMiddleware times every HTTP request per route template, and MongoCommandListener
+attributes each Mongo command to the request that issued it through a context variable
+(Motor copies the caller's context onto its executor threads). MongoPoolListener tracks
+connection pool utilisation per server.
+"""
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label pairs"""
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts, then +Inf count, then sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in sorted(items):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {count}")
+            count = series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in items)
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._callbacks: List[Tuple[str, str, str, Callable[[], Dict[Tuple, float]]]] = []
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def callback(self, name: str, help_text: str, callback: Callable[[], Dict[Tuple, float]], metric_type: str = "gauge"):
+        """Register a metric read at scrape time; callback returns {label pairs tuple: value}"""
+        self._callbacks.append((name, help_text, metric_type, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, metric_type, callback in self._callbacks:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            try:
+                values = callback()
+            except Exception as e:
+                logger.warning(f"Metric callback for {name} failed: {str(e)}")
+                continue
+            lines.extend(f"{name}{_format_labels(tuple(sorted(key)))} {value}" for key, value in values.items())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template"
+)
+requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status code"
+)
+request_db_commands = registry.histogram(
+    "http_request_db_commands", "MongoDB commands issued per HTTP request", COUNT_BUCKETS
+)
+request_db_seconds = registry.histogram(
+    "http_request_db_seconds", "Cumulative MongoDB command time per HTTP request"
+)
+mongo_command_duration = registry.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by command name"
+)
+mongo_command_failures = registry.counter(
+    "mongo_command_failures_total", "Failed MongoDB commands by command name"
+)
+mongo_pool_checkout_wait = registry.histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled MongoDB connection"
+)
+mongo_pool_checkout_failures = registry.counter(
+    "mongo_pool_checkout_failures_total", "Failed MongoDB connection checkouts by reason (e.g. timeout)"
+)
+
+
+class RequestDbStats:
+    __slots__ = ("commands", "db_seconds")
+
+    def __init__(self):
+        self.commands = 0
+        self.db_seconds = 0.0
+
+
+current_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("current_request_db_stats", default=None)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records per-command latency and charges it to the in-flight HTTP request"""
+
+    def _record(self, event, failed: bool):
+        seconds = event.duration_micros / 1_000_000
+        mongo_command_duration.observe(seconds, command=event.command_name)
+        if failed:
+            mongo_command_failures.inc(command=event.command_name)
+        stats = current_request_db_stats.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.db_seconds += seconds
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Counts open and checked-out connections per server; checkout waits are timed per thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Dict[str, int] = {}
+        self._checked_out: Dict[str, int] = {}
+        self._local = threading.local()
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def _add(self, counts: Dict[str, int], event, delta: int):
+        address = self._address(event)
+        with self._lock:
+            counts[address] = counts.get(address, 0) + delta
+
+    def _observe_wait(self):
+        started = getattr(self._local, "checkout_started", None)
+        if started is not None:
+            mongo_pool_checkout_wait.observe(time.perf_counter() - started)
+            self._local.checkout_started = None
+
+    def connections(self) -> Dict[Tuple, float]:
+        with self._lock:
+            values = {(("address", address), ("state", "open")): count for address, count in self._open.items()}
+            values.update(
+                {(("address", address), ("state", "checked_out")): count for address, count in self._checked_out.items()}
+            )
+        return values
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(self._open, event, 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(self._open, event, -1)
+
+    def connection_check_out_started(self, event):
+        # Checkout runs synchronously on one thread, from started to checked out or failed
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._observe_wait()
+        mongo_pool_checkout_failures.inc(reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        self._observe_wait()
+        self._add(self._checked_out, event, 1)
+
+    def connection_checked_in(self, event):
+        self._add(self._checked_out, event, -1)
+
+
+pool_listener = MongoPoolListener()
+registry.callback(
+    "mongo_pool_connections", "MongoDB pool connections per server by state (open, checked_out)", pool_listener.connections
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and DB usage per route; warns on likely N+1 request patterns"""
+
+    def __init__(self, app, db_command_warning_threshold: int = 20, excluded_paths=("/metrics",)):
+        self.app = app
+        self.db_command_warning_threshold = db_command_warning_threshold
+        self.excluded_paths = set(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDbStats()
+        token = current_request_db_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request_db_stats.reset(token)
+            # FastAPI stores the matched route in the (shared) scope during routing
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            request_duration.observe(elapsed, method=method, route=route_path)
+            requests_total.inc(method=method, route=route_path, status=str(status_code))
+            request_db_commands.observe(stats.commands, method=method, route=route_path)
+            request_db_seconds.observe(stats.db_seconds, method=method, route=route_path)
+            if stats.commands > self.db_command_warning_threshold:
+                logger.warning(
+                    f"{method} {route_path} issued {stats.commands} DB commands "
+                    f"({stats.db_seconds * 1000:.1f} ms); possible N+1 query pattern"
+                )
@@ -0,0 +1,201 @@
+"""
+Streaming bulk import of questions from CSV or JSONL.
+
+Rows are read one at a time, validated, and inserted in unordered insert_many batches, so memory
+use is bounded by the batch size rather than the file size. Duplicates are detected through the
+unique content_hash index on questions, both against existing questions and within the file.
+
+CSV files need a header with text, options, correct_answer, explanation, difficulty and category
+columns (image_url and video_url are optional). options is a JSON array or a "|"-separated list.
+
+Command line usage (from backend/):
+    python question_import.py questions.jsonl [--format jsonl] [--batch-size 1000]
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import sys
+from typing import Any, Awaitable, Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY_ERROR = 11000
+MAX_REPORTED_ERRORS = 1000
+CSV_FIELDS = ("text", "options", "correct_answer", "explanation", "difficulty", "category", "image_url", "video_url")
+
+
+def question_content_hash(text: str, options: List[str], category: str) -> str:
+    """Hash of the normalized question content, used to detect duplicates"""
+    def normalize(value: str) -> str:
+        return " ".join(value.split()).casefold()
+
+    payload = json.dumps([normalize(text), [normalize(option) for option in options], normalize(category)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def detect_format(filename: Optional[str]) -> str:
+    if filename and filename.lower().endswith(".csv"):
+        return "csv"
+    return "jsonl"
+
+
+def _parse_options(value: str) -> List[str]:
+    value = value.strip()
+    if value.startswith("["):
+        return json.loads(value)
+    return [option.strip() for option in value.split("|")]
+
+
+def iter_csv_rows(stream: IO[str]) -> Iterator[Tuple[int, Any]]:
+    """Yield (row number, dict or exception) for each CSV data row"""
+    reader = csv.DictReader(stream)
+    for row_number, row in enumerate(reader, start=2):
+        try:
+            record = {field: row[field] for field in CSV_FIELDS if row.get(field) not in (None, "")}
+            if "options" in record:
+                record["options"] = _parse_options(record["options"])
+            yield row_number, record
+        except (ValueError, csv.Error) as e:
+            yield row_number, e
+
+
+def iter_jsonl_rows(stream: IO[str]) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, dict or exception) for each non-blank JSONL line"""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("Expected a JSON object")
+            yield line_number, record
+        except ValueError as e:
+            yield line_number, e
+
+
+def iter_rows(stream: IO[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    if fmt == "csv":
+        return iter_csv_rows(stream)
+    if fmt == "jsonl":
+        return iter_jsonl_rows(stream)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.errors_truncated = False
+
+    def add_error(self, row: int, error: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+        else:
+            self.errors_truncated = True
+
+    def dict(self) -> Dict[str, Any]:
+        return {
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "errors": self.errors,
+            "errors_truncated": self.errors_truncated,
+        }
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+async def import_question_rows(
+    rows: Iterator[Tuple[int, Any]],
+    collection,
+    build_document: Callable[[Dict[str, Any]], Dict[str, Any]],
+    batch_size: int = 1000,
+    on_inserted: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+) -> ImportReport:
+    """
+    Validate rows with build_document (raises ValidationError/ValueError on bad rows) and insert
+    them in unordered batches. on_inserted is awaited with the documents that were actually inserted.
+    """
+    report = ImportReport()
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+
+    async def flush():
+        documents = [document for _, document in batch]
+        failed = set()
+        try:
+            await collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                if write_error.get("code") == DUPLICATE_KEY_ERROR:
+                    report.duplicates += 1
+                else:
+                    report.add_error(batch[write_error["index"]][0], write_error.get("errmsg", "Insert failed"))
+        inserted = [document for i, document in enumerate(documents) if i not in failed]
+        report.inserted += len(inserted)
+        if on_inserted and inserted:
+            await on_inserted(inserted)
+        batch.clear()
+
+    for row_number, record in rows:
+        report.processed += 1
+        if isinstance(record, Exception):
+            report.add_error(row_number, f"Could not parse row: {record}")
+            continue
+        try:
+            batch.append((row_number, build_document(record)))
+        except ValidationError as e:
+            report.add_error(row_number, _format_validation_error(e))
+            continue
+        except ValueError as e:
+            report.add_error(row_number, str(e))
+            continue
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV or JSONL file to import")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Reuse the API's validation and configuration
+    import server
+
+    async def run():
+        await server.connect_mongo()
+        await server.ensure_indexes()
+        with open(args.path, newline="", encoding="utf-8") as stream:
+            rows = iter_rows(stream, args.format or detect_format(args.path))
+            report = await import_question_rows(rows, server.db.questions, server.build_question_document, args.batch_size)
+        if report.inserted and server.cache_bus.shared:
+            # Tell running API workers to reload their question pools
+            await server.cache_bus.start(server.db, listen=False)
+            await server.cache_bus.publish("questions")
+        return report
+
+    report = asyncio.run(run())
+    json.dump(report.dict(), sys.stdout, indent=2)
+    print()
+    if not server.cache_bus.shared:
+        print("Running API servers pick up new questions after POST /api/admin/question-pool/reload", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
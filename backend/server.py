@@ -1,7 +1,10 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status, UploadFile, File
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
@@ -9,29 +12,218 @@ import os
 import jwt
 import uuid
 import hashlib
+import hmac
+import io
 import logging
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
+from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
+import bisect
+import random
+from contextlib import asynccontextmanager
 from enum import Enum
 from bson import ObjectId
 import json
+import base64
+import orjson
+from analytics import LIFETIME_PERIOD, build_analytics, rollup_updates
+from badges import BADGE_RULES, badge_ids, evaluate_badges
+from cache import InvalidationBus, LRUCache, MongoInvalidationBus
+from grading import grade_session, regrade_sessions_containing
+from question_import import DUPLICATE_KEY_ERROR, detect_format, import_question_rows, iter_rows, question_content_hash
+from session_export import EXPORT_FORMATS, SESSION_EXPORT_PROJECTION, stream_sessions
+from metrics import MetricsMiddleware, MongoCommandListener, pool_listener, registry as metrics_registry
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection; the client is created by connect_mongo() in the lifespan handler
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+db_name = os.environ['DB_NAME']
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+# Connection pool configuration. Pools are per process: with N uvicorn workers a host opens up to
+# N * maxPoolSize connections, so either set MONGO_MAX_POOL_SIZE per worker or give a per-host
+# budget in MONGO_HOST_MAX_POOL_SIZE that is split across WEB_CONCURRENCY workers.
+MONGO_MAX_POOL_SIZE = os.environ.get('MONGO_MAX_POOL_SIZE')
+MONGO_HOST_MAX_POOL_SIZE = os.environ.get('MONGO_HOST_MAX_POOL_SIZE')
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-here')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Stateless token mode: access tokens embed the claims hot routes need (user id, username) and are
+# trusted without a DB read, so they are short-lived and renewed with a refresh token; logout and
+# refresh-token rotation go through a cached deny-list
+STATELESS_AUTH = os.environ.get('STATELESS_AUTH', 'false').lower() in ('1', 'true', 'yes')
+STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES', '5'))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', '14'))
+
+# Usernames allowed to use admin-only endpoints (comma-separated); none by default
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()}
+
+# Password hashing configuration
+PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', '100000'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', '8'))
+PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS', '5'))
+
+# Requests issuing more DB commands than this are logged as likely N+1 patterns
+DB_COMMAND_WARNING_THRESHOLD = int(os.environ.get('DB_COMMAND_WARNING_THRESHOLD', '20'))
+
+# Cache invalidation between workers: "local" (single process) or "mongo" (tailed capped collection)
+CACHE_INVALIDATION_BUS = os.environ.get('CACHE_INVALIDATION_BUS', 'local').lower()
+CACHE_INVALIDATION_POLL_SECONDS = float(os.environ.get('CACHE_INVALIDATION_POLL_SECONDS', '0.5'))
+
+# Authenticated-user cache configuration
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '10000'))
+
+# Account fields loaded for authenticated requests; statistics live in user_stats
+USER_PROFILE_PROJECTION = {
+    "_id": 0, "id": 1, "username": 1, "email": 1, "created_at": 1, "theme": 1, "language": 1
+}
+
+# Compact per-user statistics document, without the regrade and completion bookkeeping
+USER_STATS_PROJECTION = {"_id": 0, "regrade_batches": 0, "completed_sessions": 0}
+# Recent session ids kept on user_stats so that replaying a completion does not count it twice
+COMPLETED_SESSION_HISTORY = 20
+USER_STATS_MIGRATION_BATCH_SIZE = 1000
+BADGE_BACKFILL_BATCH_SIZE = int(os.environ.get('BADGE_BACKFILL_BATCH_SIZE', '500'))
+
+# Question fields needed to render an exam and to grade it
+QUESTION_CACHE_PROJECTION = {
+    "_id": 0, "id": 1, "text": 1, "options": 1, "difficulty": 1, "category": 1,
+    "image_url": 1, "video_url": 1, "correct_answer": 1, "explanation": 1
+}
+QUESTION_CACHE_MAX_SIZE = int(os.environ.get('QUESTION_CACHE_MAX_SIZE', '50000'))
+# Bounds how long a worker that missed an invalidation (local bus with several workers) grades with a stale key
+QUESTION_CACHE_TTL_SECONDS = float(os.environ.get('QUESTION_CACHE_TTL_SECONDS', '300'))
+QUESTION_HASH_BACKFILL_BATCH_SIZE = 1000
+
+# Slim exam-history shape: scores and dates, no question lists or answer maps
+SESSION_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "score": 1,
+    "status": 1,
+    "started_at": 1,
+    "completed_at": 1,
+    "time_limit": 1,
+    "question_count": {"$size": "$questions"}
+}
+
+# Largest exam a client may request
+EXAM_MAX_QUESTIONS = 100
+
+# Write-behind answer buffer configuration (off by default: answers are written synchronously).
+# Single-worker deployments only: a submit handled by another worker cannot flush this worker's buffer.
+ANSWER_WRITE_BEHIND = os.environ.get('ANSWER_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+ANSWER_FLUSH_INTERVAL_MS = int(os.environ.get('ANSWER_FLUSH_INTERVAL_MS', '250'))
+ANSWER_BUFFER_MAX_SESSIONS = int(os.environ.get('ANSWER_BUFFER_MAX_SESSIONS', '5000'))
+
+# API process registry: every process heartbeats its entry, so single-process features can detect
+# other workers however they were started (WEB_CONCURRENCY, uvicorn --workers, several hosts)
+WORKER_HEARTBEAT_SECONDS = float(os.environ.get('WORKER_HEARTBEAT_SECONDS', '10'))
+WORKER_ENTRY_TTL_SECONDS = 3600
+
+# Exam expiry sweeper configuration (interval 0 disables the sweeper)
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.environ.get('SESSION_SWEEP_INTERVAL_SECONDS', '30'))
+SESSION_SWEEP_BATCH_SIZE = int(os.environ.get('SESSION_SWEEP_BATCH_SIZE', '500'))
+SESSION_EXPIRY_GRACE_SECONDS = float(os.environ.get('SESSION_EXPIRY_GRACE_SECONDS', '60'))
+SESSION_SWEEP_CLAIM_TIMEOUT_SECONDS = float(os.environ.get('SESSION_SWEEP_CLAIM_TIMEOUT_SECONDS', '300'))
+EXPIRED_SESSION_TTL_DAYS = int(os.environ.get('EXPIRED_SESSION_TTL_DAYS', '30'))
+
+# Regrade job configuration
+REGRADE_BATCH_SIZE = int(os.environ.get('REGRADE_BATCH_SIZE', '500'))
+# Set on the running job only; a unique index on it lets one regrade job run at a time
+REGRADE_JOB_LOCK = "regrade"
+
+# Session export configuration
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_MAX_BATCH_SIZE = 10000
+
+# Profile analytics configuration
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 365
+
+# Leaderboard configuration
+LEADERBOARD_SIZE = 10
+LEADERBOARD_MAX_PAGE_SIZE = 100
+LEADERBOARD_PROJECTION = {"_id": 0, "id": 1, "username": 1, "total_exams": 1, "average_score": 1, "badges": 1}
+LEADERBOARD_CACHE_TTL_SECONDS = float(os.environ.get('LEADERBOARD_CACHE_TTL_SECONDS', '5'))
+
+def mongo_pool_size() -> int:
+    if MONGO_MAX_POOL_SIZE:
+        return int(MONGO_MAX_POOL_SIZE)
+    if MONGO_HOST_MAX_POOL_SIZE:
+        workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+        return max(1, int(MONGO_HOST_MAX_POOL_SIZE) // max(1, workers))
+    return 100  # driver default
+
+def mongo_client_options() -> Dict[str, Any]:
+    options = {
+        "maxPoolSize": mongo_pool_size(),
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+async def connect_mongo():
+    """Create the client (unless a database was injected, e.g. by tests) and warm it up with a ping"""
+    global client, db
+    if db is not None:
+        return
+    options = mongo_client_options()
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandListener(), pool_listener], **options)
+    db = client[db_name]
+    # Fails startup fast if no server is selectable, and opens the first pooled connection
+    await client.admin.command("ping")
+    logger.info(f"Connected to MongoDB with pool options {options}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_db_client()
+    try:
+        yield
+    finally:
+        await shutdown_db_client()
+
+# JSON responses
+def _orjson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class MongoJSONResponse(ORJSONResponse):
+    """orjson response that also encodes ObjectId; datetimes and enums are encoded natively"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
 # Create FastAPI app
-app = FastAPI(title="E-Exam Preparation System", version="1.0.0")
+app = FastAPI(
+    title="E-Exam Preparation System",
+    version="1.0.0",
+    default_response_class=MongoJSONResponse,
+    lifespan=lifespan
+)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
@@ -44,6 +236,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency and DB instrumentation
+app.add_middleware(MetricsMiddleware, db_command_warning_threshold=DB_COMMAND_WARNING_THRESHOLD)
+
 # Enums
 class DifficultyLevel(str, Enum):
     EASY = "easy"
@@ -54,22 +249,41 @@ class ExamStatus(str, Enum):
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     SUBMITTED = "submitted"
+    EXPIRED = "expired"  # timed out without a single answer; removed by the TTL index
 
 # Pydantic Models
-class User(BaseModel):
+class UserProfile(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
     email: str
-    password_hash: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    total_exams: int = 0
-    total_score: float = 0.0
-    badges: List[str] = []
     theme: str = "light"
     language: str = "en"
+
+class User(UserProfile):
+    password_hash: str
     following: List[str] = []
     followers: List[str] = []
 
+class CategoryStats(BaseModel):
+    category: str
+    exams: int = 0
+    questions: int = 0
+    correct: int = 0
+
+class UserStats(BaseModel):
+    """Per-user statistics, stored in user_stats keyed by the user's id"""
+    id: str
+    username: str
+    total_exams: int = 0
+    total_score: float = 0.0
+    average_score: float = 0.0
+    badges: List[str] = []
+    categories: List[CategoryStats] = []
+    current_streak: int = 0
+    longest_streak: int = 0
+    last_exam_day: Optional[str] = None  # UTC date, YYYY-MM-DD
+
 class UserRegister(BaseModel):
     username: str
     email: str
@@ -79,6 +293,12 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class Question(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     text: str
@@ -89,6 +309,7 @@ class Question(BaseModel):
     category: str
     image_url: Optional[str] = None
     video_url: Optional[str] = None
+    content_hash: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class QuestionCreate(BaseModel):
@@ -101,6 +322,16 @@ class QuestionCreate(BaseModel):
     image_url: Optional[str] = None
     video_url: Optional[str] = None
 
+class QuestionUpdate(BaseModel):
+    text: Optional[str] = None
+    options: Optional[List[str]] = None
+    correct_answer: Optional[int] = None
+    explanation: Optional[str] = None
+    difficulty: Optional[DifficultyLevel] = None
+    category: Optional[str] = None
+    image_url: Optional[str] = None
+    video_url: Optional[str] = None
+
 class ExamSession(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -112,6 +343,13 @@ class ExamSession(BaseModel):
     completed_at: Optional[datetime] = None
     time_limit: int = 30  # minutes
 
+class AnswerSubmission(BaseModel):
+    question_id: str
+    selected_option: int
+
+class AnswerBatch(BaseModel):
+    answers: List[AnswerSubmission]
+
 class ExamResult(BaseModel):
     session_id: str
     score: float
@@ -121,6 +359,30 @@ class ExamResult(BaseModel):
     time_taken: int  # minutes
     detailed_results: List[Dict[str, Any]]
 
+class RegradeJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class RegradeJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    question_ids: List[str]
+    # question id -> category, previous and corrected answer; drives the per-category correct counts
+    answer_changes: Dict[str, Dict[str, Any]] = {}
+    status: RegradeJobStatus = RegradeJobStatus.PENDING
+    total_sessions: int = 0
+    processed_sessions: int = 0
+    updated_sessions: int = 0
+    user_updates: int = 0
+    batches: int = 0
+    last_session_id: Optional[str] = None  # resume cursor
+    pending_batch: Optional[Dict[str, Any]] = None  # writes of the batch in flight, replayed on resume
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    completed_at: Optional[datetime] = None
+
 class Badge(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -130,36 +392,378 @@ class Badge(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 # Utility functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed: str) -> bool:
-    return hash_password(password) == hashed
-
-def serialize_doc(doc):
-    """Convert MongoDB document to JSON serializable format"""
-    if doc is None:
-        return None
-    
-    if isinstance(doc, list):
-        return [serialize_doc(item) for item in doc]
-    
-    if isinstance(doc, dict):
-        serialized = {}
-        for key, value in doc.items():
-            if isinstance(value, ObjectId):
-                serialized[key] = str(value)
-            elif isinstance(value, datetime):
-                serialized[key] = value.isoformat()
-            elif isinstance(value, dict):
-                serialized[key] = serialize_doc(value)
-            elif isinstance(value, list):
-                serialized[key] = serialize_doc(value)
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS)
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_semaphore = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+# Verified against for unknown usernames, so that a failed login takes as long whether or not the user exists
+DUMMY_PASSWORD_HASH = pwd_context.hash(uuid.uuid4().hex)
+
+def is_legacy_password_hash(hashed: str) -> bool:
+    """Unsalted SHA-256 hex digests written before the KDF migration"""
+    return len(hashed) == 64 and not hashed.startswith("$")
+
+def password_needs_rehash(hashed: str) -> bool:
+    return is_legacy_password_hash(hashed) or pwd_context.needs_update(hashed)
+
+def _verify_password_sync(password: str, hashed: str) -> bool:
+    if is_legacy_password_hash(hashed):
+        legacy_hash = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy_hash, hashed)
+    try:
+        return pwd_context.verify(password, hashed)
+    except ValueError:
+        return False
+
+async def _run_password_task(func, *args):
+    """Run a KDF call on the bounded password pool, off the event loop"""
+    try:
+        await asyncio.wait_for(password_semaphore.acquire(), PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry"
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        password_semaphore.release()
+
+async def hash_password(password: str) -> str:
+    return await _run_password_task(pwd_context.hash, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run_password_task(_verify_password_sync, password, hashed)
+
+user_cache = LRUCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+# A single entry (the top-N response); regrades drop it early through the invalidation bus
+leaderboard_cache = LRUCache(1, LEADERBOARD_CACHE_TTL_SECONDS)
+
+class QuestionPool:
+    """In-memory question id pool indexed by (category, difficulty) for local random sampling"""
+
+    def __init__(self):
+        self._buckets: Dict[tuple, List[str]] = {}
+        self._known_ids = set()
+
+    @staticmethod
+    def _key(category: str, difficulty) -> tuple:
+        return (category, getattr(difficulty, "value", difficulty))
+
+    def add(self, question: Dict[str, Any]):
+        if question["id"] in self._known_ids:
+            return
+        self._known_ids.add(question["id"])
+        key = self._key(question["category"], question["difficulty"])
+        self._buckets.setdefault(key, []).append(question["id"])
+
+    def add_many(self, questions: List[Dict[str, Any]]):
+        for question in questions:
+            self.add(question)
+
+    def remove(self, question_id: str):
+        if question_id not in self._known_ids:
+            return
+        self._known_ids.discard(question_id)
+        for bucket in self._buckets.values():
+            if question_id in bucket:
+                bucket.remove(question_id)
+                break
+
+    async def load(self):
+        """(Re)build the pool from the questions collection"""
+        self._buckets = {}
+        self._known_ids = set()
+        cursor = db.questions.find({}, {"_id": 0, "id": 1, "category": 1, "difficulty": 1})
+        async for question in cursor:
+            self.add(question)
+        logger.info(f"Question pool loaded with {len(self._known_ids)} questions")
+
+    def sample(self, k: int, category: Optional[str] = None, difficulty: Optional[str] = None) -> List[str]:
+        """Draw k distinct question ids matching the filters, or fewer if not enough exist"""
+        difficulty = getattr(difficulty, "value", difficulty)
+        buckets = [
+            ids for (bucket_category, bucket_difficulty), ids in self._buckets.items()
+            if ids
+            and (category is None or bucket_category == category)
+            and (difficulty is None or bucket_difficulty == difficulty)
+        ]
+        # Cumulative offsets let us address the union of buckets without concatenating them
+        offsets = []
+        total = 0
+        for ids in buckets:
+            offsets.append(total)
+            total += len(ids)
+        picks = random.sample(range(total), min(k, total))
+        sampled = []
+        for pick in picks:
+            bucket_index = bisect.bisect_right(offsets, pick) - 1
+            sampled.append(buckets[bucket_index][pick - offsets[bucket_index]])
+        return sampled
+
+    def __len__(self) -> int:
+        return len(self._known_ids)
+
+question_pool = QuestionPool()
+
+class QuestionCache:
+    """LRU cache of per-question exam renderings: the answer-free public view and the grading data"""
+
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None):
+        self._entries = LRUCache(max_size, ttl_seconds)
+
+    @staticmethod
+    def _build_entry(question: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        return {
+            "public": {
+                "id": question["id"],
+                "text": question["text"],
+                "options": question["options"],
+                "difficulty": question["difficulty"],
+                "category": question["category"],
+                "image_url": question.get("image_url"),
+                "video_url": question.get("video_url")
+            },
+            "grading": {
+                "text": question["text"],
+                "options": question["options"],
+                "correct_answer": question["correct_answer"],
+                "explanation": question["explanation"]
+            }
+        }
+
+    async def get_many(self, question_ids: List[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Entries for the given ids, fetching only uncached ones; ids not in the collection are omitted"""
+        found = {}
+        missing = []
+        for question_id in question_ids:
+            entry = self._entries.get(question_id)
+            if entry is None:
+                missing.append(question_id)
             else:
-                serialized[key] = value
-        return serialized
+                found[question_id] = entry
+        
+        if missing:
+            questions = await db.questions.find(
+                {"id": {"$in": missing}}, QUESTION_CACHE_PROJECTION
+            ).to_list(len(missing))
+            for question in questions:
+                entry = self._build_entry(question)
+                found[question["id"]] = entry
+                self._entries.set(question["id"], entry)
+            for question_id in missing:
+                if question_id not in found:
+                    question_pool.remove(question_id)
+        return found
+
+    def invalidate(self, question_id: str):
+        self._entries.invalidate(question_id)
+
+    def invalidate_many(self, question_ids: Optional[List[str]]):
+        self._entries.invalidate_many(question_ids)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._entries.stats()
+
+question_cache = QuestionCache(QUESTION_CACHE_MAX_SIZE, QUESTION_CACHE_TTL_SECONDS)
+
+if CACHE_INVALIDATION_BUS == 'mongo':
+    cache_bus = MongoInvalidationBus(poll_interval_seconds=CACHE_INVALIDATION_POLL_SECONDS)
+else:
+    cache_bus = InvalidationBus()
+
+async def refresh_questions(question_ids: Optional[List[str]]):
+    """Invalidation handler: drop cached renderings and re-sync the sampling pool with the collection"""
+    if question_ids is None:
+        question_cache.clear()
+        await question_pool.load()
+        return
+    question_cache.invalidate_many(question_ids)
+    questions = await db.questions.find(
+        {"id": {"$in": question_ids}}, {"_id": 0, "id": 1, "category": 1, "difficulty": 1}
+    ).to_list(len(question_ids))
+    for question_id in question_ids:
+        question_pool.remove(question_id)
+    question_pool.add_many(questions)
+
+class TokenDenyList:
+    """In-memory copy of the unexpired revoked_tokens entries, so revocation checks need no DB read"""
+
+    def __init__(self):
+        self._expires_at: Dict[str, datetime] = {}
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._expires_at
+
+    async def load(self, jtis: Optional[List[str]] = None):
+        """Invalidation handler: read the given revocations, or reload all of them when jtis is None"""
+        now = datetime.utcnow()
+        query = {"expires_at": {"$gt": now}}
+        if jtis is not None:
+            query["jti"] = {"$in": jtis}
+        entries = {}
+        async for entry in db.revoked_tokens.find(query, {"_id": 0, "jti": 1, "expires_at": 1}):
+            entries[entry["jti"]] = entry["expires_at"]
+        if jtis is None:
+            self._expires_at = entries
+            return
+        # Entries for tokens that have expired on their own are no longer needed
+        self._expires_at = {jti: expires_at for jti, expires_at in self._expires_at.items() if expires_at > now}
+        self._expires_at.update(entries)
+
+    async def revoke(self, claims: Dict[str, Any]) -> bool:
+        """Deny a token until it expires; False if it was already revoked"""
+        result = await db.revoked_tokens.update_one(
+            {"jti": claims["jti"]},
+            {"$setOnInsert": {
+                "jti": claims["jti"],
+                "user_id": claims["sub"],
+                "expires_at": datetime.utcfromtimestamp(claims["exp"]),
+                "revoked_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        await cache_bus.publish("revoked_tokens", [claims["jti"]])
+        return result.upserted_id is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._expires_at)}
+
+token_deny_list = TokenDenyList()
+
+cache_bus.subscribe("users", user_cache.invalidate_many)
+cache_bus.subscribe("questions", refresh_questions)
+cache_bus.subscribe("leaderboard", leaderboard_cache.invalidate_many)
+cache_bus.subscribe("revoked_tokens", token_deny_list.load)
+
+class AnswerBuffer:
+    """
+    Write-behind buffer for exam answers, coalesced per (session, user) and flushed in one bulk_write.
     
-    return doc
+    The flush writes use the same ownership, in-progress and deadline filter as a direct answer
+    write, so answers for sessions that are no longer active are dropped at flush time.
+    """
+
+    def __init__(self, flush_interval_seconds: float, max_sessions: int):
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_sessions = max_sessions
+        self._pending: Dict[tuple, Dict[str, int]] = {}
+        # Serializes flushes so a session flush also waits for a bulk flush already carrying its answers
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self.flushes = 0
+        self.flushed_sessions = 0
+        self.dropped_sessions = 0
+        self.failures = 0
+
+    def add(self, session_id: str, user_id: str, answers: Dict[str, int]):
+        self._pending.setdefault((session_id, user_id), {}).update(answers)
+        if len(self._pending) >= self.max_sessions:
+            self._wakeup.set()
+
+    async def flush_session(self, session_id: str, user_id: str):
+        async with self._lock:
+            answers = self._pending.pop((session_id, user_id), None)
+            if answers:
+                await self._write({(session_id, user_id): answers})
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            await self._write(pending)
+
+    async def _write(self, pending: Dict[tuple, Dict[str, int]]):
+        deadline_filter = before_deadline(datetime.utcnow())
+        operations = [
+            UpdateOne(
+                {"id": session_id, "user_id": user_id, "status": ExamStatus.IN_PROGRESS, **deadline_filter},
+                {"$set": {f"answers.{question_id}": option for question_id, option in answers.items()}}
+            )
+            for (session_id, user_id), answers in pending.items()
+        ]
+        try:
+            await db.exam_sessions.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A write error is permanent for its entry (e.g. an answer key that is not a valid field name),
+            # so those entries are dropped; the others were applied unless the write concern failed
+            self.failures += 1
+            entries = list(pending.items())
+            failed = set()
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                (session_id, _), _ = entries[error["index"]]
+                logger.error(f"Dropped buffered answers of exam session {session_id}: {error.get('errmsg')}")
+            if e.details.get("writeConcernErrors"):
+                self._requeue({key: answers for index, (key, answers) in enumerate(entries) if index not in failed})
+                raise
+            self.dropped_sessions += len(failed)
+            self.flushes += 1
+            self.flushed_sessions += len(operations) - len(failed)
+            return
+        except (asyncio.CancelledError, ConnectionFailure):
+            # Requeue when cancelled at shutdown or when the server was unreachable; $set writes are safe to repeat
+            self.failures += 1
+            self._requeue(pending)
+            raise
+        except Exception:
+            self.failures += 1
+            self.dropped_sessions += len(pending)
+            raise
+        self.flushes += 1
+        self.flushed_sessions += len(operations)
+    
+    def _requeue(self, pending: Dict[tuple, Dict[str, int]]):
+        """Put unwritten answers back under any newer answers for the same session"""
+        for key, answers in pending.items():
+            self._pending[key] = {**answers, **self._pending.get(key, {})}
+
+    async def run(self):
+        """Flush every interval, or earlier once max_sessions sessions are pending"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Answer buffer flush failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_sessions": len(self._pending),
+            "flush_interval_seconds": self.flush_interval_seconds,
+            "flushes": self.flushes,
+            "flushed_sessions": self.flushed_sessions,
+            "dropped_sessions": self.dropped_sessions,
+            "failures": self.failures
+        }
+
+answer_buffer = AnswerBuffer(ANSWER_FLUSH_INTERVAL_MS / 1000, ANSWER_BUFFER_MAX_SESSIONS) if ANSWER_WRITE_BEHIND else None
+answer_flusher_tasks = set()
+
+def build_question_document(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a question payload and build the stored document, including its content hash"""
+    question_data = QuestionCreate(**record)
+    return Question(
+        **question_data.dict(),
+        content_hash=question_content_hash(question_data.text, question_data.options, question_data.category)
+    ).dict()
+
+async def fetch_questions_by_ids(question_ids: List[str]) -> List[Dict[str, Any]]:
+    """Fetch questions by id preserving order; ids missing from the collection are dropped from the pool"""
+    questions = await db.questions.find({"id": {"$in": question_ids}}, {"_id": 0}).to_list(len(question_ids))
+    question_dict = {q["id"]: q for q in questions}
+    for question_id in question_ids:
+        if question_id not in question_dict:
+            question_pool.remove(question_id)
+    return [question_dict[qid] for qid in question_ids if qid in question_dict]
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -171,119 +775,310 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def create_session_tokens(user_id: str, username: str) -> Dict[str, Any]:
+    """Token fields of the register, login and refresh responses"""
+    if not STATELESS_AUTH:
+        access_token = create_access_token(
+            data={"sub": user_id},
+            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        return {"access_token": access_token, "token_type": "bearer"}
+    
+    access_token = create_access_token(
+        data={"sub": user_id, "type": "access", "jti": str(uuid.uuid4()), "username": username},
+        expires_delta=timedelta(minutes=STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = create_access_token(
+        data={"sub": user_id, "type": "refresh", "jti": str(uuid.uuid4())},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+def credentials_error(detail: str = "Could not validate credentials") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_token(token: str, token_type: str = "access") -> Dict[str, Any]:
+    """Verified claims of a token of the given type; tokens issued before stateless mode count as access tokens"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        user = await db.users.find_one({"id": user_id})
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return User(**user)
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.PyJWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise credentials_error()
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise credentials_error()
+    if payload.get("jti") is not None and token_deny_list.is_revoked(payload["jti"]):
+        raise credentials_error("Token has been revoked")
+    return payload
 
-async def check_and_award_badges(user: User):
-    """Check if user qualifies for any badges and award them"""
-    badges_to_award = []
-    
-    # Badge: First Exam
-    if user.total_exams == 1 and "first_exam" not in user.badges:
-        badges_to_award.append("first_exam")
-    
-    # Badge: 10 Exams
-    if user.total_exams == 10 and "ten_exams" not in user.badges:
-        badges_to_award.append("ten_exams")
-    
-    # Badge: High Scorer (average score > 80%)
-    if user.total_exams > 0 and (user.total_score / user.total_exams) > 80 and "high_scorer" not in user.badges:
-        badges_to_award.append("high_scorer")
-    
+async def load_current_user(user_id: str) -> UserProfile:
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
+    user = await db.users.find_one({"id": user_id}, USER_PROFILE_PROJECTION)
+    if user is None:
+        raise credentials_error("User not found")
+    current_user = UserProfile(**user)
+    user_cache.set(current_user.id, current_user)
+    return current_user
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await load_current_user(decode_token(credentials.credentials)["sub"])
+
+async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """The caller's user id; in stateless mode taken from the signed claims without any DB read"""
+    payload = decode_token(credentials.credentials)
+    if STATELESS_AUTH and payload.get("type") == "access":
+        return payload["sub"]
+    return (await load_current_user(payload["sub"])).id
+
+async def get_admin_user(current_user: UserProfile = Depends(get_current_user)) -> UserProfile:
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+async def get_user_stats(user: UserProfile) -> UserStats:
+    stats = await db.user_stats.find_one({"id": user.id}, USER_STATS_PROJECTION)
+    if stats is None:
+        return UserStats(id=user.id, username=user.username)
+    return UserStats(**stats)
+
+def profile_with_stats(user: UserProfile, stats: UserStats) -> Dict[str, Any]:
+    """Account fields merged with statistics, the user shape returned by the API"""
+    return {**user.dict(), **stats.dict(exclude={"id", "username"})}
+
+def category_stats_update(deltas: Dict[str, List[int]]) -> Dict[str, Any]:
+    """Pipeline expression adding {category: (questions, correct)} from one exam to the categories array"""
+    existing = {"$ifNull": ["$categories", []]}
+    if not deltas:
+        return existing
+    updated = {
+        "$map": {
+            "input": existing,
+            "as": "entry",
+            "in": {
+                "$switch": {
+                    "branches": [
+                        {
+                            "case": {"$eq": ["$$entry.category", {"$literal": category}]},
+                            "then": {
+                                "category": "$$entry.category",
+                                "exams": {"$add": ["$$entry.exams", 1]},
+                                "questions": {"$add": ["$$entry.questions", questions]},
+                                "correct": {"$add": ["$$entry.correct", correct]}
+                            }
+                        }
+                        for category, (questions, correct) in deltas.items()
+                    ],
+                    "default": "$$entry"
+                }
+            }
+        }
+    }
+    added = {
+        "$filter": {
+            "input": {"$literal": [
+                {"category": category, "exams": 1, "questions": questions, "correct": correct}
+                for category, (questions, correct) in deltas.items()
+            ]},
+            "as": "entry",
+            "cond": {"$not": {"$in": ["$$entry.category", {"$map": {"input": existing, "as": "e", "in": "$$e.category"}}]}}
+        }
+    }
+    return {"$concatArrays": [updated, added]}
+
+def category_correct_update(deltas: List[List[Any]]) -> Dict[str, Any]:
+    """Pipeline expression shifting the correct counts of categories by regrade deltas [[category, correct], ...]"""
+    existing = {"$ifNull": ["$categories", []]}
+    if not deltas:
+        return existing
+    return {
+        "$map": {
+            "input": existing,
+            "as": "entry",
+            "in": {
+                "$switch": {
+                    "branches": [
+                        {
+                            "case": {"$eq": ["$$entry.category", {"$literal": category}]},
+                            "then": {
+                                "category": "$$entry.category",
+                                "exams": "$$entry.exams",
+                                "questions": "$$entry.questions",
+                                "correct": {"$add": ["$$entry.correct", correct]}
+                            }
+                        }
+                        for category, correct in deltas
+                    ],
+                    "default": "$$entry"
+                }
+            }
+        }
+    }
+
+def streak_update(completed_at: datetime) -> Dict[str, Any]:
+    """Pipeline expression for current_streak after an exam completed at completed_at (UTC days)"""
+    today = completed_at.date()
+    return {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": ["$last_exam_day", today.isoformat()]}, "then": {"$ifNull": ["$current_streak", 1]}},
+                {
+                    "case": {"$eq": ["$last_exam_day", (today - timedelta(days=1)).isoformat()]},
+                    "then": {"$add": [{"$ifNull": ["$current_streak", 0]}, 1]}
+                }
+            ],
+            "default": 1
+        }
+    }
+
+async def check_and_award_badges(stats: UserStats) -> List[str]:
+    """Evaluate the badge rules against a stats document and award any newly earned badges"""
+    badges_to_award = evaluate_badges(stats.dict())
     if badges_to_award:
-        await db.users.update_one(
-            {"id": user.id},
-            {"$push": {"badges": {"$each": badges_to_award}}}
+        # $addToSet keeps a concurrent award or a backfill from duplicating badges
+        await db.user_stats.update_one(
+            {"id": stats.id},
+            {"$addToSet": {"badges": {"$each": badges_to_award}}}
         )
-        return badges_to_award
-    
-    return []
+    return badges_to_award
 
 # Authentication endpoints
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
-    # Check if user already exists
-    existing_user = await db.users.find_one({"username": user_data.username})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-    
-    existing_email = await db.users.find_one({"email": user_data.email})
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create new user
+    # Create new user; uniqueness of username/email is enforced by the indexes
     user = User(
         username=user_data.username,
         email=user_data.email,
-        password_hash=hash_password(user_data.password)
+        password_hash=await hash_password(user_data.password)
     )
     
-    await db.users.insert_one(user.dict())
-    
-    # Create access token
-    access_token = create_access_token(
-        data={"sub": user.id},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    try:
+        await db.users.insert_one(user.dict())
+    except DuplicateKeyError as e:
+        key_pattern = (e.details or {}).get("keyPattern", {})
+        if "email" in key_pattern:
+            raise HTTPException(status_code=400, detail="Email already registered")
+        raise HTTPException(status_code=400, detail="Username already registered")
     
-    return {"access_token": access_token, "token_type": "bearer", "user": serialize_doc(user.dict())}
+    # Respond with the public profile only: no password hash or social graph
+    profile = UserProfile(**user.dict())
+    return MongoJSONResponse({
+        **create_session_tokens(profile.id, profile.username),
+        "user": profile_with_stats(profile, UserStats(id=profile.id, username=profile.username))
+    })
 
 @api_router.post("/auth/login")
 async def login(user_data: UserLogin):
-    user = await db.users.find_one({"username": user_data.username})
-    if not user or not verify_password(user_data.password, user["password_hash"]):
+    user = await db.users.find_one({"username": user_data.username}, {**USER_PROFILE_PROJECTION, "password_hash": 1})
+    password_hash = user["password_hash"] if user else DUMMY_PASSWORD_HASH
+    if not await verify_password(user_data.password, password_hash) or not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = create_access_token(
-        data={"sub": user["id"]},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    # Transparently upgrade legacy SHA-256 hashes and hashes with outdated cost
+    if password_needs_rehash(user["password_hash"]):
+        user["password_hash"] = await hash_password(user_data.password)
+        await db.users.update_one({"id": user["id"]}, {"$set": {"password_hash": user["password_hash"]}})
+        await cache_bus.publish("users", [user["id"]])
     
-    return {"access_token": access_token, "token_type": "bearer", "user": serialize_doc(user)}
+    user.pop("password_hash")
+    profile = UserProfile(**user)
+    stats = await get_user_stats(profile)
+    return MongoJSONResponse({
+        **create_session_tokens(profile.id, profile.username),
+        "user": profile_with_stats(profile, stats)
+    })
+
+@api_router.post("/auth/refresh")
+async def refresh_tokens(request: RefreshRequest):
+    claims = decode_token(request.refresh_token, token_type="refresh")
+    # Refresh tokens are single use: a replayed (e.g. stolen) token is rejected
+    if not await token_deny_list.revoke(claims):
+        raise credentials_error("Token has been revoked")
+    
+    # Re-read the claims that may have changed since the previous token was issued
+    user = await db.users.find_one({"id": claims["sub"]}, {"_id": 0, "id": 1, "username": 1})
+    if user is None:
+        raise credentials_error("User not found")
+    return create_session_tokens(user["id"], user["username"])
+
+@api_router.post("/auth/logout")
+async def logout(
+    request: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    tokens = [decode_token(credentials.credentials)]
+    if request is not None and request.refresh_token:
+        refresh_claims = decode_token(request.refresh_token, token_type="refresh")
+        if refresh_claims["sub"] != tokens[0]["sub"]:
+            raise credentials_error()
+        tokens.append(refresh_claims)
+    
+    # Tokens issued outside stateless mode carry no jti and simply run until they expire
+    for claims in tokens:
+        if claims.get("jti") is not None:
+            await token_deny_list.revoke(claims)
+    return {"message": "Logged out successfully"}
 
 @api_router.get("/auth/me")
-async def get_current_user_profile(current_user: User = Depends(get_current_user)):
-    return current_user
+async def get_current_user_profile(current_user: UserProfile = Depends(get_current_user)):
+    return MongoJSONResponse(profile_with_stats(current_user, await get_user_stats(current_user)))
 
 # Question management endpoints
 @api_router.post("/questions")
-async def create_question(question_data: QuestionCreate, current_user: User = Depends(get_current_user)):
-    question = Question(**question_data.dict())
-    await db.questions.insert_one(question.dict())
+async def create_question(question_data: QuestionCreate, current_user: UserProfile = Depends(get_current_user)):
+    question = Question(**build_question_document(question_data.dict()))
+    try:
+        await db.questions.insert_one(question.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Question already exists")
+    await cache_bus.publish("questions", [question.id])
     return question
 
+@api_router.post("/questions/import")
+async def import_questions(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    batch_size: int = 1000,
+    current_user: UserProfile = Depends(get_admin_user)
+):
+    fmt = format or detect_format(file.filename)
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="Format must be csv or jsonl")
+    
+    # The upload is spooled to disk by the multipart parser; rows are read and inserted batch by batch
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    try:
+        report = await import_question_rows(
+            iter_rows(stream, fmt),
+            db.questions,
+            build_question_document,
+            batch_size=max(1, min(batch_size, 10000)),
+            on_inserted=lambda inserted: cache_bus.publish("questions", [q["id"] for q in inserted])
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    finally:
+        stream.detach()
+    return report.dict()
+
 @api_router.get("/questions")
 async def get_questions(
     category: Optional[str] = None,
     difficulty: Optional[DifficultyLevel] = None,
     limit: int = 10,
-    current_user: User = Depends(get_current_user)
+    current_user: UserProfile = Depends(get_current_user)
 ):
     filter_query = {}
     if category:
@@ -291,60 +1086,115 @@ async def get_questions(
     if difficulty:
         filter_query["difficulty"] = difficulty
     
-    questions = await db.questions.find(filter_query).limit(limit).to_list(limit)
+    questions = await db.questions.find(filter_query, {"_id": 0}).limit(limit).to_list(limit)
     return [Question(**q) for q in questions]
 
 @api_router.get("/questions/random")
-async def get_random_question(current_user: User = Depends(get_current_user)):
-    pipeline = [{"$sample": {"size": 1}}]
-    questions = await db.questions.aggregate(pipeline).to_list(1)
+async def get_random_question(current_user: UserProfile = Depends(get_current_user)):
+    questions = await fetch_questions_by_ids(question_pool.sample(1))
     if not questions:
         raise HTTPException(status_code=404, detail="No questions found")
     return Question(**questions[0])
 
+@api_router.put("/questions/{question_id}")
+async def update_question(
+    question_id: str,
+    question_data: QuestionUpdate,
+    current_user: UserProfile = Depends(get_admin_user)
+):
+    update_data = question_data.dict(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    # Only the media links may be cleared; the other fields are required on a question
+    null_fields = [field for field, value in update_data.items() if value is None and field not in ("image_url", "video_url")]
+    if null_fields:
+        raise HTTPException(status_code=400, detail=f"Fields cannot be null: {', '.join(null_fields)}")
+    
+    current = await db.questions.find_one({"id": question_id}, {"_id": 0})
+    if not current:
+        raise HTTPException(status_code=404, detail="Question not found")
+    # Validate the merged question before anything is written
+    merged = Question(**{**current, **update_data})
+    update_data["content_hash"] = question_content_hash(merged.text, merged.options, merged.category)
+    
+    try:
+        # The hash is derived from the content read above, so the write requires it to be unchanged
+        previous = await db.questions.find_one_and_update(
+            {"id": question_id, "text": current["text"], "options": current["options"], "category": current["category"]},
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Question already exists")
+    if not previous:
+        raise HTTPException(status_code=409, detail="Question was modified concurrently, please retry")
+    
+    question = Question(**{**previous, **update_data})
+    await cache_bus.publish("questions", [question_id])
+    
+    # A corrected answer key makes every past score that includes this question stale
+    regrade_job = None
+    if "correct_answer" in update_data and update_data["correct_answer"] != previous["correct_answer"]:
+        regrade_job = await start_regrade_job([question_id], {question_id: {
+            "category": previous["category"],
+            "previous": previous["correct_answer"],
+            "correct": update_data["correct_answer"]
+        }})
+    
+    return {"question": question, "regrade_job": regrade_job}
+
 # Exam session endpoints
+def before_deadline(now: datetime) -> Dict[str, Any]:
+    """
+    Filter clause matching sessions whose time limit has not run out at now.
+    
+    Requests are accepted for SESSION_EXPIRY_GRACE_SECONDS past the deadline, to allow for answers
+    in flight at the buzzer; the sweeper claims overdue sessions only after the same grace.
+    """
+    deadline = {"$add": [
+        "$started_at", {"$multiply": [{"$ifNull": ["$time_limit", 30]}, 60000]}, SESSION_EXPIRY_GRACE_SECONDS * 1000
+    ]}
+    return {"$expr": {"$lt": [now, deadline]}}
+
+async def raise_inactive_session_error(session_id: str, user_id: str):
+    """Raise the right error after a conditional session write matched nothing"""
+    # Only the failure path pays for a read
+    session = await db.exam_sessions.find_one(
+        {"id": session_id, "user_id": user_id}, {"_id": 0, "status": 1, "started_at": 1, "time_limit": 1}
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Exam session not found")
+    grace = timedelta(seconds=SESSION_EXPIRY_GRACE_SECONDS)
+    if session["status"] == ExamStatus.IN_PROGRESS and session_deadline(session) + grace <= datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Exam time limit exceeded")
+    raise HTTPException(status_code=400, detail="Exam session is not active")
+
 @api_router.post("/exam/start")
 async def start_exam(
-    num_questions: int = 10,
+    num_questions: int = Query(10, ge=1, le=EXAM_MAX_QUESTIONS),
     category: Optional[str] = None,
     difficulty: Optional[DifficultyLevel] = None,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
-    # Build query for random questions
-    filter_query = {}
-    if category:
-        filter_query["category"] = category
-    if difficulty:
-        filter_query["difficulty"] = difficulty
-    
-    # Get random questions
-    pipeline = [{"$match": filter_query}, {"$sample": {"size": num_questions}}]
-    questions = await db.questions.aggregate(pipeline).to_list(num_questions)
+    # Draw random question ids from the in-memory pool, then fetch only those documents
+    question_ids = question_pool.sample(num_questions, category=category or None, difficulty=difficulty)
+    cached_questions = await question_cache.get_many(question_ids)
+    question_ids = [qid for qid in question_ids if qid in cached_questions]
     
-    if len(questions) < num_questions:
+    if len(question_ids) < num_questions:
         raise HTTPException(status_code=400, detail="Not enough questions available")
     
     # Create exam session
     exam_session = ExamSession(
-        user_id=current_user.id,
-        questions=[q["id"] for q in questions]
+        user_id=user_id,
+        questions=question_ids
     )
     
     await db.exam_sessions.insert_one(exam_session.dict())
     
-    # Return questions without correct answers
-    safe_questions = []
-    for q in questions:
-        safe_q = {
-            "id": q["id"],
-            "text": q["text"],
-            "options": q["options"],
-            "difficulty": q["difficulty"],
-            "category": q["category"],
-            "image_url": q.get("image_url"),
-            "video_url": q.get("video_url")
-        }
-        safe_questions.append(safe_q)
+    # Return the cached answer-free renderings
+    safe_questions = [cached_questions[qid]["public"] for qid in question_ids]
     
     return {
         "session_id": exam_session.id,
@@ -357,68 +1207,163 @@ async def submit_answer(
     session_id: str,
     question_id: str,
     selected_option: int,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
-    session = await db.exam_sessions.find_one({"id": session_id, "user_id": current_user.id})
-    if not session:
-        raise HTTPException(status_code=404, detail="Exam session not found")
-    
-    if session["status"] != ExamStatus.IN_PROGRESS:
-        raise HTTPException(status_code=400, detail="Exam session is not active")
+    if answer_buffer is not None:
+        answer_buffer.add(session_id, user_id, {question_id: selected_option})
+        return {"message": "Answer submitted successfully"}
     
-    # Update answer
-    await db.exam_sessions.update_one(
-        {"id": session_id},
+    # Ownership, status and deadline are part of the filter, so a valid answer costs one round trip
+    result = await db.exam_sessions.update_one(
+        {"id": session_id, "user_id": user_id, "status": ExamStatus.IN_PROGRESS, **before_deadline(datetime.utcnow())},
         {"$set": {f"answers.{question_id}": selected_option}}
     )
     
+    if result.matched_count == 0:
+        await raise_inactive_session_error(session_id, user_id)
+    
     return {"message": "Answer submitted successfully"}
 
+@api_router.post("/exam/{session_id}/answers")
+async def submit_answers(
+    session_id: str,
+    batch: AnswerBatch,
+    user_id: str = Depends(get_current_user_id)
+):
+    if not batch.answers:
+        return {"message": "No answers submitted", "answers_saved": 0}
+    
+    # Later entries for the same question win, matching sequential single submits
+    answers = {a.question_id: a.selected_option for a in batch.answers}
+    
+    if answer_buffer is not None:
+        answer_buffer.add(session_id, user_id, answers)
+        return {"message": "Answers submitted successfully", "answers_saved": len(answers)}
+    
+    result = await db.exam_sessions.update_one(
+        {"id": session_id, "user_id": user_id, "status": ExamStatus.IN_PROGRESS, **before_deadline(datetime.utcnow())},
+        {"$set": {f"answers.{question_id}": option for question_id, option in answers.items()}}
+    )
+    
+    if result.matched_count == 0:
+        await raise_inactive_session_error(session_id, user_id)
+    
+    return {"message": "Answers submitted successfully", "answers_saved": len(answers)}
+
 @api_router.post("/exam/{session_id}/submit")
-async def submit_exam(session_id: str, current_user: User = Depends(get_current_user)):
-    session = await db.exam_sessions.find_one({"id": session_id, "user_id": current_user.id})
+async def submit_exam(session_id: str, current_user: UserProfile = Depends(get_current_user)):
+    # Buffered answers must reach the session before it is claimed and graded
+    if answer_buffer is not None:
+        await answer_buffer.flush_session(session_id, current_user.id)
+    
+    # Atomically claim the session so concurrent or retried submits grade it exactly once. The claim is
+    # timestamped like a sweeper claim, so a claim abandoned by a crashed worker is taken over by a
+    # later retry (or by the sweeper) once it times out. Past its deadline a session is left to the sweeper.
+    completed_at = datetime.utcnow()
+    claim_token = str(uuid.uuid4())
+    stale_claim = completed_at - timedelta(seconds=SESSION_SWEEP_CLAIM_TIMEOUT_SECONDS)
+    session = await db.exam_sessions.find_one_and_update(
+        {
+            "id": session_id,
+            "user_id": current_user.id,
+            "$or": [
+                {"status": ExamStatus.IN_PROGRESS, **before_deadline(completed_at)},
+                {"status": ExamStatus.SUBMITTED, "swept_at": {"$lt": stale_claim}}
+            ]
+        },
+        {"$set": {
+            "status": ExamStatus.SUBMITTED,
+            "completed_at": completed_at,
+            "sweep_token": claim_token,
+            "swept_at": completed_at
+        }},
+        projection={"_id": 0, "questions": 1, "answers": 1, "started_at": 1},
+        return_document=ReturnDocument.AFTER
+    )
     if not session:
-        raise HTTPException(status_code=404, detail="Exam session not found")
+        await raise_inactive_session_error(session_id, current_user.id)
     
-    if session["status"] != ExamStatus.IN_PROGRESS:
-        raise HTTPException(status_code=400, detail="Exam session is not active")
+    try:
+        return await record_exam_completion(
+            session_id, session, current_user.id, current_user.username, completed_at, claim_token
+        )
+    except Exception:
+        # Release the claim so that the client's retry can grade the session right away
+        try:
+            await db.exam_sessions.update_one(
+                {"id": session_id, "status": ExamStatus.SUBMITTED, "sweep_token": claim_token},
+                {"$set": {"status": ExamStatus.IN_PROGRESS}, "$unset": {"completed_at": "", "sweep_token": "", "swept_at": ""}}
+            )
+        except Exception as e:
+            logger.error(f"Failed to release the claim on exam session {session_id}: {str(e)}")
+        raise
+
+async def record_exam_completion(
+    session_id: str,
+    session: Dict[str, Any],
+    user_id: str,
+    username: str,
+    completed_at: datetime,
+    claim_token: str
+) -> Dict[str, Any]:
+    """
+    Grade a claimed (submitted) session and record the score, user stats, rollups and badges.
     
-    # Get all questions for this session
-    questions = await db.questions.find({"id": {"$in": session["questions"]}}).to_list(len(session["questions"]))
-    question_dict = {q["id"]: q for q in questions}
+    The stats and rollup writes are guarded by the session id and the session is marked completed
+    last, only while claim_token still holds the claim. A completion that fails part way therefore
+    leaves the session claimable, and the retry counts the exam exactly once.
+    """
+    # Get grading data for this session's questions, mostly from the question cache
+    cached_questions = await question_cache.get_many(session["questions"])
+    question_dict = {qid: entry["grading"] for qid, entry in cached_questions.items()}
     
     # Calculate score
-    total_questions = len(session["questions"])
-    correct_answers = 0
-    detailed_results = []
+    grade = grade_session(
+        session["questions"],
+        session["answers"],
+        {qid: question["correct_answer"] for qid, question in question_dict.items()}
+    )
+    total_questions = grade.total_questions
+    correct_answers = grade.correct_answers
+    score = grade.score
     
-    for question_id in session["questions"]:
+    detailed_results = []
+    category_deltas: Dict[str, List[int]] = {}
+    difficulty_deltas: Dict[str, List[int]] = {}
+    for question_id, is_correct in zip(session["questions"], grade.is_correct):
         question = question_dict[question_id]
-        user_answer = session["answers"].get(question_id)
-        correct_answer = question["correct_answer"]
-        is_correct = user_answer == correct_answer
-        
-        if is_correct:
-            correct_answers += 1
-        
+        public_question = cached_questions[question_id]["public"]
+        for deltas, key in ((category_deltas, public_question["category"]), (difficulty_deltas, public_question["difficulty"])):
+            delta = deltas.setdefault(key, [0, 0])
+            delta[0] += 1
+            delta[1] += is_correct
         detailed_results.append({
             "question_id": question_id,
             "question_text": question["text"],
             "options": question["options"],
-            "user_answer": user_answer,
-            "correct_answer": correct_answer,
+            "user_answer": session["answers"].get(question_id),
+            "correct_answer": question["correct_answer"],
             "is_correct": is_correct,
             "explanation": question["explanation"]
         })
     
-    score = (correct_answers / total_questions) * 100
-    
     # Update session
-    completed_at = datetime.utcnow()
     time_taken = int((completed_at - session["started_at"]).total_seconds() / 60)
     
-    await db.exam_sessions.update_one(
-        {"id": session_id},
+    # Update the compact stats document (totals, leaderboard average, per-category counts, streak) in one
+    # atomic pipeline upsert; the account document in users is not written at all. The analytics
+    # rollups are independent counters and are written concurrently.
+    updated_stats, _ = await asyncio.gather(
+        record_completion_stats(session_id, user_id, username, score, category_deltas, completed_at),
+        record_completion_rollups(
+            rollup_updates(user_id, session_id, completed_at.date().isoformat(), score, category_deltas, difficulty_deltas)
+        )
+    )
+    
+    # Completing the session releases the claim; if another worker took the claim over, it completes
+    # the session instead, and the guarded writes above are not repeated by either side
+    result = await db.exam_sessions.update_one(
+        {"id": session_id, "status": ExamStatus.SUBMITTED, "sweep_token": claim_token},
         {
             "$set": {
                 "status": ExamStatus.COMPLETED,
@@ -427,21 +1372,11 @@ async def submit_exam(session_id: str, current_user: User = Depends(get_current_
             }
         }
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=400, detail="Exam session is not active")
     
-    # Update user stats
-    await db.users.update_one(
-        {"id": current_user.id},
-        {
-            "$inc": {
-                "total_exams": 1,
-                "total_score": score
-            }
-        }
-    )
-    
-    # Check for badges
-    updated_user = await db.users.find_one({"id": current_user.id})
-    new_badges = await check_and_award_badges(User(**updated_user))
+    # Check for badges against the post-update document
+    new_badges = await check_and_award_badges(UserStats(**updated_stats))
     
     # Create result
     result = ExamResult(
@@ -459,52 +1394,119 @@ async def submit_exam(session_id: str, current_user: User = Depends(get_current_
         "new_badges": new_badges
     }
 
+async def record_completion_stats(
+    session_id: str,
+    user_id: str,
+    username: str,
+    score: float,
+    category_deltas: Dict[str, List[int]],
+    completed_at: datetime
+) -> Dict[str, Any]:
+    """Add one exam to the user's stats document unless it was already counted; returns the document"""
+    pipeline = [
+        {"$set": {
+            "username": {"$literal": username},
+            "total_exams": {"$add": [{"$ifNull": ["$total_exams", 0]}, 1]},
+            "total_score": {"$add": [{"$ifNull": ["$total_score", 0]}, score]},
+            "categories": category_stats_update(category_deltas),
+            "current_streak": streak_update(completed_at),
+            "last_exam_day": completed_at.date().isoformat(),
+            "completed_sessions": {"$slice": [
+                {"$concatArrays": [{"$ifNull": ["$completed_sessions", []]}, [session_id]]}, -COMPLETED_SESSION_HISTORY
+            ]}
+        }},
+        {"$set": {
+            "average_score": {"$divide": ["$total_score", "$total_exams"]},
+            "longest_streak": {"$max": [{"$ifNull": ["$longest_streak", 0]}, "$current_streak"]}
+        }}
+    ]
+    # The upsert of an already counted session collides with the existing document; so does a concurrent
+    # first exam of the same user, which succeeds on the retry
+    for attempt in range(2):
+        try:
+            return await db.user_stats.find_one_and_update(
+                {"id": user_id, "completed_sessions": {"$ne": session_id}},
+                pipeline,
+                projection=USER_STATS_PROJECTION,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            stats = await db.user_stats.find_one({"id": user_id, "completed_sessions": session_id}, USER_STATS_PROJECTION)
+            if stats is not None:
+                return stats
+            if attempt:
+                raise
+
+async def record_completion_rollups(operations: List[UpdateOne]):
+    """Apply guarded rollup upserts; a duplicate key means counted already, or a concurrent first insert that is retried"""
+    for attempt in range(2):
+        try:
+            await db.user_rollups.bulk_write(operations, ordered=False)
+            return
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if not write_errors or any(error.get("code") != DUPLICATE_KEY_ERROR for error in write_errors):
+                raise
+            if attempt:
+                return
+            operations = [operations[error["index"]] for error in write_errors]
+
+async def get_session_summaries(user_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Most recent completed sessions for a user in the slim summary shape"""
+    pipeline = [
+        {"$match": {"user_id": user_id, "status": ExamStatus.COMPLETED}},
+        {"$sort": {"completed_at": -1}},
+        {"$limit": limit},
+        {"$project": SESSION_SUMMARY_PROJECTION}
+    ]
+    return await db.exam_sessions.aggregate(pipeline).to_list(limit)
+
 @api_router.get("/exam/history")
-async def get_exam_history(current_user: User = Depends(get_current_user)):
+async def get_exam_history(current_user: UserProfile = Depends(get_current_user)):
     try:
-        sessions = await db.exam_sessions.find(
-            {"user_id": current_user.id, "status": ExamStatus.COMPLETED}
-        ).sort("completed_at", -1).to_list(50)
+        sessions = await get_session_summaries(current_user.id, 50)
         
-        # Serialize documents to handle ObjectId
-        serialized_sessions = serialize_doc(sessions)
-        return serialized_sessions
+        # Raw documents go straight to orjson, bypassing jsonable_encoder
+        return MongoJSONResponse(sessions)
     except Exception as e:
         logger.error(f"Error in exam history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # User profile endpoints
 @api_router.get("/profile")
-async def get_profile(current_user: User = Depends(get_current_user)):
+async def get_profile(current_user: UserProfile = Depends(get_current_user)):
     try:
         # Get recent exam sessions
-        recent_sessions = await db.exam_sessions.find(
-            {"user_id": current_user.id, "status": ExamStatus.COMPLETED}
-        ).sort("completed_at", -1).limit(5).to_list(5)
-        
-        # Serialize sessions to handle ObjectId
-        serialized_sessions = serialize_doc(recent_sessions)
-        
-        # Calculate average score
-        avg_score = 0
-        if current_user.total_exams > 0:
-            avg_score = current_user.total_score / current_user.total_exams
+        recent_sessions = await get_session_summaries(current_user.id, 5)
+        stats = await get_user_stats(current_user)
         
-        return {
-            "user": serialize_doc(current_user.dict()),
-            "recent_sessions": serialized_sessions,
-            "average_score": avg_score,
-            "total_exams": current_user.total_exams
-        }
+        return MongoJSONResponse({
+            "user": profile_with_stats(current_user, stats),
+            "recent_sessions": recent_sessions,
+            "average_score": stats.average_score,
+            "total_exams": stats.total_exams
+        })
     except Exception as e:
         logger.error(f"Error in profile: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@api_router.get("/profile/analytics")
+async def get_profile_analytics(days: int = ANALYTICS_DEFAULT_DAYS, current_user: UserProfile = Depends(get_current_user)):
+    """Lifetime and daily accuracy per category and difficulty, read from the precomputed rollups"""
+    days = max(1, min(days, ANALYTICS_MAX_DAYS))
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    rollups = await db.user_rollups.find(
+        {"user_id": current_user.id, "$or": [{"period": LIFETIME_PERIOD}, {"period": {"$gte": since}}]},
+        {"_id": 0, "user_id": 0, "sessions": 0}
+    ).to_list(None)
+    return MongoJSONResponse(build_analytics(rollups))
+
 @api_router.put("/profile/settings")
 async def update_settings(
     theme: Optional[str] = None,
     language: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: UserProfile = Depends(get_current_user)
 ):
     update_data = {}
     if theme:
@@ -516,35 +1518,519 @@ async def update_settings(
         {"id": current_user.id},
         {"$set": update_data}
     )
+    await cache_bus.publish("users", [current_user.id])
     
     return {"message": "Settings updated successfully"}
 
 # Leaderboard endpoint
 @api_router.get("/leaderboard")
-async def get_leaderboard(current_user: User = Depends(get_current_user)):
+async def get_leaderboard(current_user: UserProfile = Depends(get_current_user)):
     try:
-        pipeline = [
-            {"$match": {"total_exams": {"$gt": 0}}},
-            {"$addFields": {"average_score": {"$divide": ["$total_score", "$total_exams"]}}},
-            {"$sort": {"average_score": -1}},
-            {"$limit": 10},
-            {"$project": {
-                "username": 1,
-                "total_exams": 1,
-                "average_score": 1,
-                "badges": 1
-            }}
-        ]
+        cached_leaderboard = leaderboard_cache.get("top")
+        if cached_leaderboard is not None:
+            return MongoJSONResponse(cached_leaderboard)
         
-        leaderboard = await db.users.aggregate(pipeline).to_list(10)
+        # Indexed top-N read on the stored average_score
+        leaderboard = await db.user_stats.find(
+            {"total_exams": {"$gt": 0}},
+            {"_id": 0, "username": 1, "total_exams": 1, "average_score": 1, "badges": 1}
+        ).sort([("average_score", DESCENDING), ("id", ASCENDING)]).limit(LEADERBOARD_SIZE).to_list(LEADERBOARD_SIZE)
         
-        # Serialize documents to handle ObjectId
-        serialized_leaderboard = serialize_doc(leaderboard)
-        return serialized_leaderboard
+        leaderboard_cache.set("top", leaderboard)
+        return MongoJSONResponse(leaderboard)
     except Exception as e:
         logger.error(f"Error in leaderboard: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def encode_leaderboard_cursor(entry: Dict[str, Any]) -> str:
+    payload = json.dumps([entry["average_score"], entry["id"]]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+def decode_leaderboard_cursor(cursor: str) -> tuple:
+    try:
+        average_score, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(average_score), str(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid leaderboard cursor")
+
+def ranked_after(average_score: float, user_id: str) -> Dict[str, Any]:
+    """Filter for users ranked strictly below the given (average_score, id) position"""
+    return {
+        "total_exams": {"$gt": 0},
+        "$or": [
+            {"average_score": {"$lt": average_score}},
+            {"average_score": average_score, "id": {"$gt": user_id}}
+        ]
+    }
+
+def ranked_before(average_score: float, user_id: str) -> Dict[str, Any]:
+    """Filter for users ranked strictly above the given (average_score, id) position"""
+    return {
+        "total_exams": {"$gt": 0},
+        "$or": [
+            {"average_score": {"$gt": average_score}},
+            {"average_score": average_score, "id": {"$lt": user_id}}
+        ]
+    }
+
+@api_router.get("/leaderboard/page")
+async def get_leaderboard_page(
+    cursor: Optional[str] = None,
+    limit: int = LEADERBOARD_SIZE,
+    current_user: UserProfile = Depends(get_current_user)
+):
+    limit = max(1, min(limit, LEADERBOARD_MAX_PAGE_SIZE))
+    filter_query: Dict[str, Any] = {"total_exams": {"$gt": 0}}
+    if cursor:
+        filter_query = ranked_after(*decode_leaderboard_cursor(cursor))
+    
+    entries = await db.user_stats.find(filter_query, LEADERBOARD_PROJECTION).sort(
+        [("average_score", DESCENDING), ("id", ASCENDING)]
+    ).limit(limit).to_list(limit)
+    
+    next_cursor = encode_leaderboard_cursor(entries[-1]) if len(entries) == limit else None
+    return MongoJSONResponse({"entries": entries, "next_cursor": next_cursor})
+
+@api_router.get("/leaderboard/me")
+async def get_leaderboard_rank(neighbours: int = 2, current_user: UserProfile = Depends(get_current_user)):
+    stats = await get_user_stats(current_user)
+    if stats.total_exams == 0:
+        return {"rank": None, "entry": None, "above": [], "below": []}
+    
+    neighbours = max(0, min(neighbours, LEADERBOARD_MAX_PAGE_SIZE))
+    position = (stats.average_score, stats.id)
+    
+    # Rank is one plus the number of users ordered ahead, counted on the leaderboard index
+    rank = await db.user_stats.count_documents(ranked_before(*position)) + 1
+    
+    above = []
+    below = []
+    if neighbours:
+        above = await db.user_stats.find(ranked_before(*position), LEADERBOARD_PROJECTION).sort(
+            [("average_score", ASCENDING), ("id", DESCENDING)]
+        ).limit(neighbours).to_list(neighbours)
+        above.reverse()
+        below = await db.user_stats.find(ranked_after(*position), LEADERBOARD_PROJECTION).sort(
+            [("average_score", DESCENDING), ("id", ASCENDING)]
+        ).limit(neighbours).to_list(neighbours)
+    
+    entry = stats.dict(include={"id", "username", "total_exams", "average_score", "badges"})
+    return MongoJSONResponse({"rank": rank, "entry": entry, "above": above, "below": below})
+
+# Exam expiry sweeper
+session_sweeper_tasks = set()
+
+def session_deadline(session: Dict[str, Any]) -> datetime:
+    return session["started_at"] + timedelta(minutes=session.get("time_limit", 30))
+
+async def claim_overdue_sessions(now: datetime, token: str) -> int:
+    """Move one batch of overdue sessions (and sweeps or submits abandoned mid-way) to SUBMITTED under token"""
+    grace = timedelta(seconds=SESSION_EXPIRY_GRACE_SECONDS)
+    stale_claim = now - timedelta(seconds=SESSION_SWEEP_CLAIM_TIMEOUT_SECONDS)
+    
+    # The (status, started_at) index bounds the scan to sessions old enough to be overdue
+    candidates = await db.exam_sessions.find(
+        {"status": ExamStatus.IN_PROGRESS, "started_at": {"$lt": now - grace}},
+        {"_id": 0, "id": 1, "started_at": 1, "time_limit": 1}
+    ).sort("started_at", ASCENDING).limit(SESSION_SWEEP_BATCH_SIZE).to_list(SESSION_SWEEP_BATCH_SIZE)
+    overdue_ids = [
+        candidate["id"] for candidate in candidates
+        if session_deadline(candidate) + grace < now
+    ]
+    
+    result = await db.exam_sessions.update_many(
+        {
+            "$or": [
+                {"id": {"$in": overdue_ids}, "status": ExamStatus.IN_PROGRESS},
+                {"status": ExamStatus.SUBMITTED, "swept_at": {"$lt": stale_claim}}
+            ]
+        },
+        {"$set": {"status": ExamStatus.SUBMITTED, "sweep_token": token, "swept_at": now}}
+    )
+    return result.modified_count
+
+async def sweep_expired_sessions() -> Dict[str, int]:
+    """Expire overdue in-progress sessions: answered ones are auto-graded like a submit, empty ones marked expired"""
+    report = {"graded": 0, "expired": 0}
+    if answer_buffer is not None:
+        await answer_buffer.flush()
+    while True:
+        now = datetime.utcnow()
+        token = str(uuid.uuid4())
+        if not await claim_overdue_sessions(now, token):
+            return report
+        
+        sessions = await db.exam_sessions.find(
+            {"sweep_token": token, "status": ExamStatus.SUBMITTED},
+            {"_id": 0, "id": 1, "user_id": 1, "questions": 1, "answers": 1, "started_at": 1, "time_limit": 1}
+        ).to_list(None)
+        unanswered_ids = [session["id"] for session in sessions if not session.get("answers")]
+        answered = [session for session in sessions if session.get("answers")]
+        
+        if unanswered_ids:
+            await db.exam_sessions.update_many(
+                {"id": {"$in": unanswered_ids}, "sweep_token": token},
+                {"$set": {"status": ExamStatus.EXPIRED, "expired_at": now}}
+            )
+            report["expired"] += len(unanswered_ids)
+        
+        users = await db.users.find(
+            {"id": {"$in": list({session["user_id"] for session in answered})}}, {"_id": 0, "id": 1, "username": 1}
+        ).to_list(None)
+        usernames = {user["id"]: user["username"] for user in users}
+        for session in answered:
+            # The session ended at its deadline, not when the sweeper noticed
+            completed_at = min(now, session_deadline(session))
+            try:
+                await record_exam_completion(
+                    session["id"], session, session["user_id"], usernames.get(session["user_id"], ""), completed_at, token
+                )
+            except Exception as e:
+                # Left claimed; it is retried once the claim times out
+                logger.error(f"Failed to auto-grade expired session {session['id']}: {str(e)}")
+                continue
+            report["graded"] += 1
+
+async def run_session_sweeper():
+    while True:
+        try:
+            report = await sweep_expired_sessions()
+            if report["graded"] or report["expired"]:
+                logger.info(f"Session sweeper graded {report['graded']} and expired {report['expired']} overdue sessions")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Session sweeper failed: {str(e)}")
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+
+def start_session_sweeper():
+    if SESSION_SWEEP_INTERVAL_SECONDS <= 0:
+        return
+    task = asyncio.create_task(run_session_sweeper())
+    session_sweeper_tasks.add(task)
+    task.add_done_callback(session_sweeper_tasks.discard)
+
+# Regrade jobs
+regrade_tasks = set()
+
+async def start_regrade_job(
+    question_ids: List[str], answer_changes: Optional[Dict[str, Dict[str, Any]]] = None
+) -> RegradeJob:
+    job = RegradeJob(question_ids=question_ids, answer_changes=answer_changes or {})
+    job.total_sessions = await db.exam_sessions.count_documents(
+        {"questions": {"$in": question_ids}, "status": ExamStatus.COMPLETED}
+    )
+    await db.regrade_jobs.insert_one(job.dict())
+    schedule_regrade_job(job.id)
+    return job
+
+def schedule_regrade_job(job_id: str):
+    task = asyncio.create_task(run_regrade_job(job_id))
+    regrade_tasks.add(task)
+    task.add_done_callback(regrade_tasks.discard)
+
+async def apply_regrade_batch(job_id: str, pending_batch: Dict[str, Any]):
+    """Apply a checkpointed batch; all writes are idempotent so a replay after a crash is safe"""
+    session_scores = pending_batch["session_scores"]
+    user_deltas = pending_batch["user_deltas"]
+    category_deltas = pending_batch.get("category_deltas") or {}
+    user_ids = list({**user_deltas, **category_deltas})
+    token = pending_batch["token"]
+    
+    if session_scores:
+        await db.exam_sessions.bulk_write(
+            [UpdateOne({"id": sid}, {"$set": {"score": score}}) for sid, score in session_scores.items()],
+            ordered=False
+        )
+    if user_ids:
+        # The batch token guards against applying the same delta twice to a user
+        await db.user_stats.bulk_write(
+            [
+                UpdateOne(
+                    {"id": user_id, "regrade_batches": {"$ne": token}},
+                    [
+                        {"$set": {
+                            "total_score": {"$add": [{"$ifNull": ["$total_score", 0]}, user_deltas.get(user_id, 0.0)]},
+                            "categories": category_correct_update(category_deltas.get(user_id, [])),
+                            "regrade_batches": {
+                                "$slice": [{"$concatArrays": [{"$ifNull": ["$regrade_batches", []]}, [token]]}, -20]
+                            }
+                        }},
+                        {"$set": {"average_score": {"$cond": [
+                            {"$gt": ["$total_exams", 0]}, {"$divide": ["$total_score", "$total_exams"]}, 0
+                        ]}}}
+                    ]
+                )
+                for user_id in user_ids
+            ],
+            ordered=False
+        )
+        # Corrected accuracies can earn badges; awarding is idempotent
+        async for stats in db.user_stats.find({"id": {"$in": user_ids}}, USER_STATS_PROJECTION):
+            await check_and_award_badges(UserStats(**stats))
+    
+    await db.regrade_jobs.update_one(
+        {"id": job_id},
+        {
+            "$set": {
+                "pending_batch": None,
+                "last_session_id": pending_batch["last_session_id"],
+                "updated_at": datetime.utcnow()
+            },
+            "$inc": {
+                "processed_sessions": pending_batch["processed_sessions"],
+                "updated_sessions": len(session_scores),
+                "user_updates": len(user_ids),
+                "batches": 1
+            }
+        }
+    )
+
+async def run_regrade_job(job_id: str):
+    """Stream affected sessions in batches, recompute scores and correct sessions and user totals"""
+    # Jobs run one at a time: two jobs for the same question would both read the same old scores
+    # and apply the correction to user totals twice
+    try:
+        job = await db.regrade_jobs.find_one_and_update(
+            {"id": job_id, "status": {"$in": [RegradeJobStatus.PENDING, RegradeJobStatus.RUNNING]}},
+            {"$set": {"status": RegradeJobStatus.RUNNING, "lock": REGRADE_JOB_LOCK, "updated_at": datetime.utcnow()}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another job holds the lock and starts this one when it finishes
+        logger.info(f"Regrade job {job_id} queued behind a running job")
+        return
+    if not job:
+        return
+    
+    try:
+        if job.get("pending_batch"):
+            await apply_regrade_batch(job_id, job["pending_batch"])
+            job = await db.regrade_jobs.find_one({"id": job_id}, {"_id": 0})
+        
+        query = {"id": {"$gt": job["last_session_id"]}} if job.get("last_session_id") else None
+        batch_number = job.get("batches", 0)
+        answer_changes = job.get("answer_changes") or {}
+        async for sessions, grades in regrade_sessions_containing(
+            db, job["question_ids"], batch_size=REGRADE_BATCH_SIZE, query=query
+        ):
+            session_scores = {}
+            user_deltas: Dict[str, float] = {}
+            user_category_deltas: Dict[str, Dict[str, int]] = {}
+            for session, new_score in zip(sessions, grades.scores.tolist()):
+                old_score = session.get("score") or 0.0
+                if new_score != old_score:
+                    session_scores[session["id"]] = new_score
+                    user_deltas[session["user_id"]] = user_deltas.get(session["user_id"], 0.0) + new_score - old_score
+                # Category counts follow the job's own answer change, so that jobs for successive corrections
+                # of one question add up even when the first job already graded against the latest key
+                for question_id, change in answer_changes.items():
+                    if question_id not in session["questions"]:
+                        continue
+                    selected = (session.get("answers") or {}).get(question_id)
+                    delta = (selected == change["correct"]) - (selected == change["previous"])
+                    if delta:
+                        deltas = user_category_deltas.setdefault(session["user_id"], {})
+                        deltas[change["category"]] = deltas.get(change["category"], 0) + delta
+            
+            batch_number += 1
+            pending_batch = {
+                "token": f"{job_id}:{batch_number}",
+                "session_scores": session_scores,
+                "user_deltas": user_deltas,
+                # Pairs rather than a mapping: category names are not safe field names
+                "category_deltas": {
+                    user_id: [[category, delta] for category, delta in deltas.items() if delta]
+                    for user_id, deltas in user_category_deltas.items() if any(deltas.values())
+                },
+                "processed_sessions": len(sessions),
+                "last_session_id": sessions[-1]["id"]
+            }
+            # Checkpoint the batch's writes before applying them so a restart can replay them
+            await db.regrade_jobs.update_one({"id": job_id}, {"$set": {"pending_batch": pending_batch}})
+            await apply_regrade_batch(job_id, pending_batch)
+            # Let API requests run between batches
+            await asyncio.sleep(0)
+        
+        await db.regrade_jobs.update_one(
+            {"id": job_id},
+            {
+                "$set": {
+                    "status": RegradeJobStatus.COMPLETED,
+                    "completed_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                },
+                "$unset": {"lock": ""}
+            }
+        )
+        await cache_bus.publish("leaderboard")
+        logger.info(f"Regrade job {job_id} completed")
+    except asyncio.CancelledError:
+        # Left in RUNNING state holding the lock; resumed from the checkpoint on next startup
+        raise
+    except Exception as e:
+        logger.error(f"Regrade job {job_id} failed: {str(e)}")
+        await db.regrade_jobs.update_one(
+            {"id": job_id},
+            {
+                "$set": {"status": RegradeJobStatus.FAILED, "error": str(e), "updated_at": datetime.utcnow()},
+                "$unset": {"lock": ""}
+            }
+        )
+    await schedule_next_regrade_job()
+
+async def schedule_next_regrade_job():
+    """Start the oldest job that was queued while another one held the lock"""
+    job = await db.regrade_jobs.find_one(
+        {"status": RegradeJobStatus.PENDING}, {"_id": 0, "id": 1}, sort=[("created_at", ASCENDING)]
+    )
+    if job:
+        schedule_regrade_job(job["id"])
+
+async def resume_regrade_jobs():
+    """Restart jobs interrupted by a shutdown or crash from their last checkpoint"""
+    async for job in db.regrade_jobs.find(
+        {"status": {"$in": [RegradeJobStatus.PENDING, RegradeJobStatus.RUNNING]}}, {"_id": 0, "id": 1}
+    ):
+        logger.info(f"Resuming regrade job {job['id']}")
+        schedule_regrade_job(job["id"])
+
+@api_router.get("/admin/regrade-jobs/{job_id}")
+async def get_regrade_job(job_id: str, current_user: UserProfile = Depends(get_admin_user)):
+    job = await db.regrade_jobs.find_one({"id": job_id}, {"_id": 0, "pending_batch": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Regrade job not found")
+    total = job["total_sessions"]
+    job["progress"] = job["processed_sessions"] / total if total else 1.0
+    return MongoJSONResponse(job)
+
+@api_router.post("/admin/question-pool/reload")
+async def reload_question_pool(current_user: UserProfile = Depends(get_admin_user)):
+    # Also reloads the pools of the other workers when the invalidation bus is shared
+    await cache_bus.publish("questions")
+    return {"message": f"Question pool reloaded with {len(question_pool)} questions"}
+
+async def lookup_export_questions(question_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Question metadata for the session export join, served through the bounded question cache"""
+    entries = await question_cache.get_many(question_ids)
+    return {
+        question_id: {
+            "category": entry["public"]["category"],
+            "difficulty": entry["public"]["difficulty"],
+            "correct_answer": entry["grading"]["correct_answer"]
+        }
+        for question_id, entry in entries.items()
+    }
+
+@api_router.get("/admin/exports/exam-sessions")
+async def export_exam_sessions(
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category: Optional[str] = None,
+    user_id: Optional[str] = None,
+    include_questions: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    current_user: UserProfile = Depends(get_admin_user)
+):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    query: Dict[str, Any] = {}
+    if user_id:
+        query["user_id"] = user_id
+    if start or end:
+        query["started_at"] = {}
+        if start:
+            query["started_at"]["$gte"] = start
+        if end:
+            query["started_at"]["$lt"] = end
+    if category:
+        # Sessions have no category of their own; match those containing any question from it
+        question_ids = await db.questions.distinct("id", {"category": category})
+        query["questions"] = {"$in": question_ids}
+    
+    batch_size = max(1, min(batch_size, EXPORT_MAX_BATCH_SIZE))
+    cursor = db.exam_sessions.find(query, SESSION_EXPORT_PROJECTION, batch_size=batch_size)
+    content = stream_sessions(
+        cursor,
+        format,
+        batch_size,
+        question_lookup=lookup_export_questions if include_questions else None
+    )
+    filename = f"exam_sessions_{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Badges
+badge_backfill_tasks = set()
+
+@api_router.get("/badges")
+async def get_badges(current_user: UserProfile = Depends(get_current_user)):
+    return [rule.dict() for rule in BADGE_RULES]
+
+async def backfill_badges(batch_size: int = BADGE_BACKFILL_BATCH_SIZE) -> Dict[str, int]:
+    """Evaluate the badge rules for every user, awarding in one unordered bulk write per batch"""
+    report = {"users_scanned": 0, "users_awarded": 0, "badges_awarded": 0}
+    operations = []
+    
+    async def flush():
+        if operations:
+            await db.user_stats.bulk_write(operations, ordered=False)
+            operations.clear()
+    
+    # Users already holding every badge cannot earn anything new
+    cursor = db.user_stats.find(
+        {"badges": {"$not": {"$all": badge_ids()}}}, USER_STATS_PROJECTION, batch_size=batch_size
+    )
+    async for stats in cursor:
+        report["users_scanned"] += 1
+        badges_to_award = evaluate_badges(stats)
+        if badges_to_award:
+            operations.append(UpdateOne(
+                {"id": stats["id"]}, {"$addToSet": {"badges": {"$each": badges_to_award}}}
+            ))
+            report["users_awarded"] += 1
+            report["badges_awarded"] += len(badges_to_award)
+        if report["users_scanned"] % batch_size == 0:
+            await flush()
+    await flush()
+    return report
+
+async def run_badge_backfill():
+    try:
+        report = await backfill_badges()
+        logger.info(f"Badge backfill finished: {report}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Badge backfill failed: {str(e)}")
+
+@api_router.post("/admin/badges/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def start_badge_backfill(current_user: UserProfile = Depends(get_admin_user)):
+    if badge_backfill_tasks:
+        raise HTTPException(status_code=409, detail="Badge backfill already running")
+    task = asyncio.create_task(run_badge_backfill())
+    badge_backfill_tasks.add(task)
+    task.add_done_callback(badge_backfill_tasks.discard)
+    return {"message": "Badge backfill started"}
+
+# Cache statistics endpoint
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(current_user: UserProfile = Depends(get_admin_user)):
+    return {
+        "users": user_cache.stats(),
+        "questions": question_cache.stats(),
+        "leaderboard": leaderboard_cache.stats(),
+        "invalidation_bus": cache_bus.stats(),
+        "token_deny_list": token_deny_list.stats(),
+        "answer_buffer": answer_buffer.stats() if answer_buffer is not None else None
+    }
+
 # Initialize default questions
 @api_router.post("/admin/init")
 async def initialize_questions():
@@ -600,15 +2086,38 @@ async def initialize_questions():
     # Insert sample questions
     questions_to_insert = []
     for q_data in sample_questions:
-        question = Question(**q_data)
-        questions_to_insert.append(question.dict())
+        questions_to_insert.append(build_question_document(q_data))
     
     await db.questions.insert_many(questions_to_insert)
+    await cache_bus.publish("questions", [question["id"] for question in questions_to_insert])
     return {"message": f"Initialized {len(sample_questions)} questions"}
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Prometheus metrics endpoint
+metrics_registry.callback(
+    "user_cache_lookups_total",
+    "Authenticated-user cache lookups by result",
+    lambda: {(("result", "hit"),): user_cache.hits, (("result", "miss"),): user_cache.misses},
+    metric_type="counter"
+)
+metrics_registry.callback(
+    "mongo_pool_max_size",
+    "Configured maxPoolSize of this process's MongoDB client, per server",
+    lambda: {(): mongo_pool_size()}
+)
+if answer_buffer is not None:
+    metrics_registry.callback(
+        "answer_buffer_pending_sessions",
+        "Sessions with answers waiting in the write-behind buffer",
+        lambda: {(): answer_buffer.stats()["pending_sessions"]}
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -616,6 +2125,255 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
+# Index definitions for the hot query paths
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "user_stats": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("average_score", DESCENDING), ("id", ASCENDING)],
+            name="leaderboard",
+            partialFilterExpression={"total_exams": {"$gt": 0}}
+        ),
+    ],
+    "questions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("category", ASCENDING), ("difficulty", ASCENDING)], name="category_difficulty"),
+        IndexModel(
+            [("content_hash", ASCENDING)],
+            name="content_hash_unique",
+            unique=True,
+            partialFilterExpression={"content_hash": {"$type": "string"}}
+        ),
+    ],
+    "exam_sessions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("completed_at", DESCENDING)],
+            name="user_status_completed_at"
+        ),
+        IndexModel([("questions", ASCENDING), ("id", ASCENDING)], name="questions_id"),
+        IndexModel([("started_at", ASCENDING)], name="started_at"),
+        IndexModel([("status", ASCENDING), ("started_at", ASCENDING)], name="status_started_at"),
+        IndexModel(
+            [("expired_at", ASCENDING)],
+            name="expired_at_ttl",
+            expireAfterSeconds=EXPIRED_SESSION_TTL_DAYS * 24 * 3600
+        ),
+    ],
+    "user_rollups": [
+        IndexModel(
+            [("user_id", ASCENDING), ("period", ASCENDING), ("dimension", ASCENDING), ("key", ASCENDING)],
+            name="user_period_dimension_key_unique",
+            unique=True
+        ),
+    ],
+    "api_workers": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("heartbeat_at", ASCENDING)], name="heartbeat_at_ttl", expireAfterSeconds=WORKER_ENTRY_TTL_SECONDS),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], name="jti_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "regrade_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("lock", ASCENDING)], name="lock_unique", unique=True, sparse=True),
+    ],
+}
+
+async def ensure_indexes():
+    """Create all declared indexes; safe to run on every startup. A missing unique index fails startup."""
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                # Unique indexes enforce invariants (e.g. register relies on them to reject duplicate
+                # accounts), so running without one is unsafe; other indexes only cost performance
+                if index.document.get("unique"):
+                    raise RuntimeError(f"Failed to create unique index {name} on {collection_name}: {str(e)}") from e
+                logger.error(f"Failed to create index {name} on {collection_name}: {str(e)}")
+
+LEGACY_USER_STATS_FIELDS = ("total_exams", "total_score", "average_score", "badges", "regrade_batches")
+
+async def migrate_user_stats():
+    """Move statistics still embedded in user documents into user_stats; safe to rerun after a crash"""
+    migrated = 0
+    while True:
+        users = await db.users.find(
+            {"total_exams": {"$exists": True}},
+            {"_id": 0, "id": 1, "username": 1, **{field: 1 for field in LEGACY_USER_STATS_FIELDS}}
+        ).limit(USER_STATS_MIGRATION_BATCH_SIZE).to_list(USER_STATS_MIGRATION_BATCH_SIZE)
+        if not users:
+            break
+        
+        operations = []
+        for user in users:
+            total_exams = user.get("total_exams") or 0
+            total_score = user.get("total_score") or 0.0
+            if not total_exams and not user.get("badges"):
+                continue
+            stats = UserStats(
+                id=user["id"],
+                username=user["username"],
+                total_exams=total_exams,
+                total_score=total_score,
+                average_score=total_score / total_exams if total_exams else 0.0,
+                badges=user.get("badges") or []
+            ).dict()
+            stats["regrade_batches"] = user.get("regrade_batches") or []
+            # An existing stats document is newer than the embedded copy
+            operations.append(UpdateOne({"id": user["id"]}, {"$setOnInsert": stats}, upsert=True))
+        if operations:
+            await db.user_stats.bulk_write(operations, ordered=False)
+        await db.users.update_many(
+            {"id": {"$in": [user["id"] for user in users]}},
+            {"$unset": {field: "" for field in LEGACY_USER_STATS_FIELDS}}
+        )
+        migrated += len(users)
+    if migrated:
+        logger.info(f"Migrated statistics of {migrated} users to user_stats")
+
+async def backfill_question_hashes():
+    """Add content hashes to questions stored before duplicate detection; safe to rerun after a crash"""
+    hashed = 0
+    duplicates = 0
+    while True:
+        questions = await db.questions.find(
+            {"content_hash": {"$exists": False}}, {"_id": 0, "id": 1, "text": 1, "options": 1, "category": 1}
+        ).limit(QUESTION_HASH_BACKFILL_BATCH_SIZE).to_list(QUESTION_HASH_BACKFILL_BATCH_SIZE)
+        if not questions:
+            break
+        
+        operations = [
+            UpdateOne(
+                {"id": question["id"]},
+                {"$set": {"content_hash": question_content_hash(
+                    question.get("text") or "", question.get("options") or [], question.get("category") or ""
+                )}}
+            )
+            for question in questions
+        ]
+        failed = []
+        try:
+            await db.questions.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            failed = [
+                questions[write_error["index"]]["id"] for write_error in e.details.get("writeErrors", [])
+                if write_error.get("code") == DUPLICATE_KEY_ERROR
+            ]
+        if failed:
+            # Existing duplicates are kept; a null hash is outside the unique index and marks them as processed
+            await db.questions.update_many({"id": {"$in": failed}}, {"$set": {"content_hash": None}})
+        hashed += len(questions) - len(failed)
+        duplicates += len(failed)
+    if hashed or duplicates:
+        logger.info(f"Backfilled content hashes of {hashed} questions; {duplicates} duplicates left unhashed")
+
+worker_id = str(uuid.uuid4())
+worker_heartbeat_tasks = set()
+
+async def register_worker() -> int:
+    """Heartbeat this process's registry entry; returns the number of live API processes, this one included"""
+    now = datetime.utcnow()
+    await db.api_workers.update_one(
+        {"id": worker_id},
+        {"$set": {"host": socket.gethostname(), "pid": os.getpid(), "heartbeat_at": now}},
+        upsert=True
+    )
+    # An entry is live while its process keeps heartbeating; a crashed process drops out after a few intervals
+    return await db.api_workers.count_documents(
+        {"heartbeat_at": {"$gte": now - timedelta(seconds=3 * WORKER_HEARTBEAT_SECONDS)}}
+    )
+
+async def run_worker_heartbeat():
+    while True:
+        await asyncio.sleep(WORKER_HEARTBEAT_SECONDS)
+        try:
+            live_workers = await register_worker()
+            if live_workers > 1 and answer_buffer is not None:
+                logger.error(f"ANSWER_WRITE_BEHIND is on but {live_workers} API processes are running; answers may be lost")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Worker heartbeat failed: {str(e)}")
+
+def start_worker_heartbeat():
+    task = asyncio.create_task(run_worker_heartbeat())
+    worker_heartbeat_tasks.add(task)
+    task.add_done_callback(worker_heartbeat_tasks.discard)
+
+def check_answer_write_behind(live_workers: int):
+    """
+    Refuse write-behind when a session's requests may be spread over several API processes.
+    
+    Workers started together can register in the same instant; the later ones see the earlier
+    entries and refuse to start, and the heartbeat logs an error if another process shows up later.
+    """
+    if answer_buffer is None:
+        return
+    if int(os.environ.get('WEB_CONCURRENCY', '1')) > 1 or cache_bus.shared or live_workers > 1:
+        raise RuntimeError(
+            "ANSWER_WRITE_BEHIND requires a single API worker: answers buffered by one worker would be "
+            "lost when another worker handles the submit"
+        )
+
+def check_cache_bus(live_workers: int):
+    """Warn when several API processes run on the process-local invalidation bus"""
+    workers = max(live_workers, int(os.environ.get('WEB_CONCURRENCY', '1')))
+    if workers > 1 and not cache_bus.shared:
+        logger.warning(
+            f"{workers} API processes share the database but CACHE_INVALIDATION_BUS is local: other workers "
+            f"see question edits only after QUESTION_CACHE_TTL_SECONDS ({QUESTION_CACHE_TTL_SECONDS:g}s) and "
+            "new questions only after a restart; set CACHE_INVALIDATION_BUS=mongo"
+        )
+
+async def startup_db_client():
+    await connect_mongo()
+    await ensure_indexes()
+    live_workers = await register_worker()
+    check_answer_write_behind(live_workers)
+    check_cache_bus(live_workers)
+    start_worker_heartbeat()
+    await migrate_user_stats()
+    await backfill_question_hashes()
+    # Subscribe before loading so that no invalidation published in between is missed
+    await cache_bus.start(db)
+    await question_pool.load()
+    await token_deny_list.load()
+    await resume_regrade_jobs()
+    start_session_sweeper()
+    if answer_buffer is not None:
+        task = asyncio.create_task(answer_buffer.run())
+        answer_flusher_tasks.add(task)
+        task.add_done_callback(answer_flusher_tasks.discard)
+
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    background_tasks = (
+        list(regrade_tasks) + list(badge_backfill_tasks) + list(session_sweeper_tasks) + list(answer_flusher_tasks)
+        + list(worker_heartbeat_tasks)
+    )
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await cache_bus.stop()
+    # Persist buffered answers before the client goes away
+    if answer_buffer is not None:
+        try:
+            await answer_buffer.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush buffered answers on shutdown: {str(e)}")
+    try:
+        await db.api_workers.delete_one({"id": worker_id})
+    except Exception as e:
+        logger.warning(f"Failed to deregister worker: {str(e)}")
+    if client is not None:
+        client.close()
+    password_executor.shutdown(wait=False)
\ No newline at end of file
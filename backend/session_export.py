@@ -0,0 +1,156 @@
+"""
+Streaming export of exam sessions as NDJSON or CSV.
+
+Sessions are read from a Mongo cursor and encoded one batch at a time, so memory use is bounded by
+the batch size (plus the bounded question cache used for the metadata join), not by the result set.
+
+With question metadata, NDJSON rows carry a nested `questions` list while CSV switches to one row
+per (session, question) so that the output stays flat.
+"""
+
+import csv
+import io
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import orjson
+
+SESSION_EXPORT_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "user_id": 1,
+    "status": 1,
+    "score": 1,
+    "started_at": 1,
+    "completed_at": 1,
+    "time_limit": 1,
+    "questions": 1,
+    "answers": 1,
+}
+
+SESSION_COLUMNS = (
+    "session_id", "user_id", "status", "score", "started_at", "completed_at",
+    "time_limit", "question_count", "answered_count",
+)
+QUESTION_COLUMNS = ("question_id", "category", "difficulty", "selected_option", "correct_answer", "is_correct")
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+QuestionLookup = Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]]
+
+
+def _session_row(session: Dict[str, Any]) -> Dict[str, Any]:
+    answers = session.get("answers") or {}
+    return {
+        "session_id": session["id"],
+        "user_id": session["user_id"],
+        "status": session.get("status"),
+        "score": session.get("score"),
+        "started_at": session.get("started_at"),
+        "completed_at": session.get("completed_at"),
+        "time_limit": session.get("time_limit"),
+        "question_count": len(session.get("questions") or []),
+        "answered_count": len(answers),
+    }
+
+
+def _question_rows(session: Dict[str, Any], questions: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    answers = session.get("answers") or {}
+    rows = []
+    for question_id in session.get("questions") or []:
+        question = questions.get(question_id, {})
+        selected_option = answers.get(question_id)
+        correct_answer = question.get("correct_answer")
+        rows.append({
+            "question_id": question_id,
+            "category": question.get("category"),
+            "difficulty": question.get("difficulty"),
+            "selected_option": selected_option,
+            "correct_answer": correct_answer,
+            "is_correct": selected_option is not None and selected_option == correct_answer,
+        })
+    return rows
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None:
+        return ""
+    return getattr(value, "value", value)
+
+
+class _CsvEncoder:
+    def __init__(self, columns: tuple):
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def header(self) -> bytes:
+        self._writer.writerow(self.columns)
+        return self._drain()
+
+    def rows(self, rows: List[Dict[str, Any]]) -> bytes:
+        for row in rows:
+            self._writer.writerow([_csv_value(row[column]) for column in self.columns])
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def _encode_ndjson(rows: List[Dict[str, Any]]) -> bytes:
+    return b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+async def stream_sessions(
+    cursor,
+    fmt: str,
+    batch_size: int,
+    question_lookup: Optional[QuestionLookup] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Encode sessions from cursor batch by batch. question_lookup maps question ids to
+    {"category", "difficulty", "correct_answer"} and enables the question join when given.
+    """
+    csv_encoder = None
+    if fmt == "csv":
+        columns = SESSION_COLUMNS + (QUESTION_COLUMNS if question_lookup else ())
+        csv_encoder = _CsvEncoder(columns)
+        yield csv_encoder.header()
+
+    batch = []
+
+    async def encode_batch() -> bytes:
+        questions = {}
+        if question_lookup:
+            question_ids = list({qid for session in batch for qid in session.get("questions") or []})
+            questions = await question_lookup(question_ids)
+
+        rows = []
+        for session in batch:
+            row = _session_row(session)
+            if question_lookup is None:
+                rows.append(row)
+            elif csv_encoder is None:
+                row["questions"] = _question_rows(session, questions)
+                rows.append(row)
+            else:
+                rows.extend({**row, **question_row} for question_row in _question_rows(session, questions))
+        if csv_encoder is not None:
+            return csv_encoder.rows(rows)
+        return _encode_ndjson(rows)
+
+    async for session in cursor:
+        batch.append(session)
+        if len(batch) >= batch_size:
+            yield await encode_batch()
+            batch = []
+    if batch:
+        yield await encode_batch()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend modules are imported top-level, as when running `uvicorn server:app` from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,50 @@
+import pytest
+
+from analytics import LIFETIME_PERIOD, OVERALL_KEY, build_analytics, rollup_updates
+
+
+def test_rollup_updates_cover_lifetime_and_day():
+    updates = rollup_updates("u1", "s1", "2024-05-01", 50.0, {"Math": [2, 1]}, {"easy": [2, 1]})
+    documents = [(update._filter, update._doc["$inc"]) for update in updates]
+    assert len(documents) == 6
+    guard = {"sessions": {"$ne": "s1"}}
+    assert (
+        {"user_id": "u1", "period": LIFETIME_PERIOD, "dimension": "overall", "key": OVERALL_KEY, **guard},
+        {"exams": 1, "questions": 2, "correct": 1, "total_score": 50.0},
+    ) in documents
+    assert (
+        {"user_id": "u1", "period": "2024-05-01", "dimension": "category", "key": "Math", **guard},
+        {"exams": 1, "questions": 2, "correct": 1},
+    ) in documents
+    assert all(update._upsert for update in updates)
+    assert all(update._doc["$push"]["sessions"]["$each"] == ["s1"] for update in updates)
+
+
+def test_build_analytics_shapes_and_sorts():
+    rollups = [
+        {"period": LIFETIME_PERIOD, "dimension": "overall", "key": OVERALL_KEY,
+         "exams": 2, "questions": 10, "correct": 5, "total_score": 100.0},
+        {"period": LIFETIME_PERIOD, "dimension": "category", "key": "Science", "exams": 1, "questions": 4, "correct": 4},
+        {"period": LIFETIME_PERIOD, "dimension": "category", "key": "Art", "exams": 1, "questions": 6, "correct": 1},
+        {"period": "2024-05-02", "dimension": "difficulty", "key": "hard", "exams": 1, "questions": 3, "correct": 0},
+        {"period": "2024-05-01", "dimension": "overall", "key": OVERALL_KEY,
+         "exams": 1, "questions": 5, "correct": 5, "total_score": 100.0},
+    ]
+    analytics = build_analytics(rollups)
+    assert analytics["overall"] == {"exams": 2, "questions": 10, "correct": 5, "accuracy": 50.0, "average_score": 50.0}
+    assert [entry["category"] for entry in analytics["categories"]] == ["Art", "Science"]
+    assert analytics["categories"][1]["accuracy"] == 100.0
+    assert [day["date"] for day in analytics["daily"]] == ["2024-05-01", "2024-05-02"]
+    assert analytics["daily"][0]["average_score"] == 100.0
+    # A day with only breakdown rollups still has zeroed totals
+    assert analytics["daily"][1]["exams"] == 0
+    assert analytics["daily"][1]["difficulties"][0] == pytest.approx(
+        {"difficulty": "hard", "exams": 1, "questions": 3, "correct": 0, "accuracy": 0.0}
+    )
+
+
+def test_build_analytics_without_rollups():
+    analytics = build_analytics([])
+    assert analytics["overall"]["exams"] == 0
+    assert analytics["overall"]["average_score"] == 0.0
+    assert analytics["daily"] == []
@@ -0,0 +1,57 @@
+import pytest
+
+from badges import (
+    BADGE_RULES, AverageScoreRule, BadgeRule, CategoryAccuracyRule, CountRule, StreakRule, evaluate_badges,
+    register_badge_rule
+)
+
+
+def test_count_rule_threshold():
+    rule = CountRule("ten", "Ten", "", "total_exams", 10)
+    assert not rule.evaluate({"total_exams": 9})
+    assert rule.evaluate({"total_exams": 10})
+    assert not rule.evaluate({})
+
+
+def test_average_score_rule_is_strict_and_needs_exams():
+    rule = AverageScoreRule("high", "High", "", above=80, min_exams=2)
+    assert not rule.evaluate({"total_exams": 2, "average_score": 80})
+    assert not rule.evaluate({"total_exams": 1, "average_score": 95})
+    assert rule.evaluate({"total_exams": 2, "average_score": 80.5})
+
+
+def test_streak_rule_uses_longest_streak():
+    rule = StreakRule("streak", "Streak", "", days=3)
+    assert rule.evaluate({"current_streak": 0, "longest_streak": 3})
+    assert not rule.evaluate({"current_streak": 2, "longest_streak": 2})
+
+
+def test_category_accuracy_rule():
+    categories = [
+        {"category": "Math", "questions": 20, "correct": 18},
+        {"category": "Art", "questions": 10, "correct": 10},
+    ]
+    assert CategoryAccuracyRule("any", "Any", "", min_accuracy=90, min_questions=20).evaluate({"categories": categories})
+    assert not CategoryAccuracyRule("art", "Art", "", min_accuracy=90, min_questions=20, category="Art").evaluate(
+        {"categories": categories}
+    )
+    assert not CategoryAccuracyRule("strict", "Strict", "", min_accuracy=95, min_questions=20).evaluate(
+        {"categories": categories}
+    )
+
+
+def test_evaluate_badges_skips_held_badges():
+    stats = {"total_exams": 1, "average_score": 90, "badges": ["first_exam"]}
+    awarded = evaluate_badges(stats)
+    assert "first_exam" not in awarded
+    assert "high_scorer" in awarded
+
+
+def test_register_badge_rule_rejects_duplicate_ids():
+    with pytest.raises(ValueError):
+        register_badge_rule(CountRule(BADGE_RULES[0].badge_id, "Dup", "", "total_exams", 1))
+
+
+def test_badge_rule_requires_evaluate():
+    with pytest.raises(TypeError):
+        BadgeRule("abstract", "Abstract", "")
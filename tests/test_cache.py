@@ -0,0 +1,67 @@
+import asyncio
+
+import cache
+from cache import InvalidationBus, LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_lru_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = LRUCache(10, ttl_seconds=5)
+    lru.set("a", 1)
+    now[0] += 4
+    assert lru.get("a") == 1
+    now[0] += 2
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_lru_disabled_by_zero_size_or_ttl():
+    for lru in (LRUCache(0), LRUCache(10, ttl_seconds=0)):
+        lru.set("a", 1)
+        assert lru.get("a") is None
+
+
+def test_lru_invalidate_many_and_stats():
+    lru = LRUCache(10)
+    for key in "abc":
+        lru.set(key, key)
+    lru.invalidate_many(["a", "missing"])
+    assert lru.get("a") is None
+    assert lru.get("b") == "b"
+    lru.invalidate_many(None)
+    assert len(lru) == 0
+    stats = lru.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_local_bus_dispatches_to_sync_and_async_handlers():
+    bus = InvalidationBus()
+    received = []
+
+    async def async_handler(keys):
+        received.append(("async", keys))
+
+    def failing_handler(keys):
+        raise RuntimeError("boom")
+
+    bus.subscribe("users", lambda keys: received.append(("sync", keys)))
+    bus.subscribe("users", failing_handler)
+    bus.subscribe("users", async_handler)
+    asyncio.run(bus.publish("users", ["u1"]))
+    asyncio.run(bus.publish("questions"))
+    assert received == [("sync", ["u1"]), ("async", ["u1"])]
+    assert bus.stats() == {"type": "local", "published": 2, "received": 0, "errors": 1}
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from grading import UNANSWERED, AnswerKey, EncodedSessions, _grade_encoded, grade_session, grade_sessions
+
+
+def test_grade_session_counts_correct_and_unanswered():
+    grade = grade_session(["q1", "q2", "q3"], {"q1": 0, "q2": 2}, {"q1": 0, "q2": 1, "q3": 3})
+    assert grade.correct_answers == 1
+    assert grade.total_questions == 3
+    assert grade.is_correct == [True, False, False]
+    assert grade.score == pytest.approx(100 / 3)
+
+
+def test_grade_session_without_questions_scores_zero():
+    assert grade_session([], {}, {}).score == 0.0
+
+
+def test_grade_encoded_segment_sums():
+    is_correct = np.array([True, False, True, True, False, True], dtype=bool)
+    lengths = np.array([2, 0, 3, 1], dtype=np.int64)
+    grade = _grade_encoded(["a", "b", "c", "d"], lengths, is_correct)
+    assert grade.correct_answers.tolist() == [1, 0, 2, 1]
+    assert grade.total_questions.tolist() == [2, 0, 3, 1]
+    assert grade.scores.tolist() == [50.0, 0.0, pytest.approx(200 / 3), 100.0]
+
+
+def test_grade_sessions_matches_live_path():
+    key = {"q1": 1, "q2": 0, "q3": 2}
+    sessions = [
+        {"id": "s1", "questions": ["q1", "q2"], "answers": {"q1": 1, "q2": 0}},
+        {"id": "s2", "questions": ["q3", "q1", "q2"], "answers": {"q3": 1}},
+        {"id": "s3", "questions": ["q2"], "answers": None},
+    ]
+    batch = grade_sessions(sessions, AnswerKey(key))
+    assert batch.session_ids == ["s1", "s2", "s3"]
+    for session, score in zip(sessions, batch.scores):
+        assert score == grade_session(session["questions"], session["answers"] or {}, key).score
+
+
+def test_encoded_sessions_regrade_against_corrected_key():
+    key = AnswerKey({"q1": 0, "q2": 1})
+    encoded = EncodedSessions([{"id": "s1", "questions": ["q1", "q2"], "answers": {"q1": 2, "q2": 1}}], key)
+    assert encoded.grade(key).scores.tolist() == [50.0]
+    key.set("q1", 2)
+    assert encoded.grade(key).scores.tolist() == [100.0]
+
+
+def test_unanswered_never_matches_key():
+    key = AnswerKey({"q1": UNANSWERED - 1})
+    assert grade_sessions([{"id": "s1", "questions": ["q1"], "answers": {}}], key).correct_answers.tolist() == [0]
+
+
+def test_empty_batch():
+    batch = EncodedSessions([], AnswerKey()).grade(AnswerKey())
+    assert batch.session_ids == []
+    assert batch.scores.shape == (0,)
@@ -0,0 +1,93 @@
+import asyncio
+import io
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from question_import import (
+    DUPLICATE_KEY_ERROR, detect_format, import_question_rows, iter_csv_rows, iter_jsonl_rows, iter_rows,
+    question_content_hash
+)
+
+
+def test_content_hash_normalizes_whitespace_and_case():
+    assert question_content_hash(" What  is 2+2? ", ["Four", "five"], "Math") == question_content_hash(
+        "what is 2+2?", ["four", "FIVE"], "math"
+    )
+    assert question_content_hash("Q", ["a", "b"], "Math") != question_content_hash("Q", ["b", "a"], "Math")
+
+
+def test_detect_format():
+    assert detect_format("questions.CSV") == "csv"
+    assert detect_format("questions.jsonl") == "jsonl"
+    assert detect_format(None) == "jsonl"
+    with pytest.raises(ValueError):
+        iter_rows(io.StringIO(""), "xml")
+
+
+def test_csv_rows_parse_options_and_report_errors():
+    data = (
+        "text,options,correct_answer,explanation,difficulty,category\n"
+        'Q1,a|b|c,1,e,easy,Math\n'
+        'Q2,"[""x"",""y""]",0,e,hard,Math\n'
+        'Q3,"[broken",0,e,hard,Math\n'
+    )
+    rows = list(iter_csv_rows(io.StringIO(data)))
+    assert [row_number for row_number, _ in rows] == [2, 3, 4]
+    assert rows[0][1]["options"] == ["a", "b", "c"]
+    assert rows[1][1]["options"] == ["x", "y"]
+    assert isinstance(rows[2][1], ValueError)
+
+
+def test_jsonl_rows_skip_blank_lines_and_report_errors():
+    rows = list(iter_jsonl_rows(io.StringIO('{"text": "Q"}\n\n[1, 2]\n{bad\n')))
+    assert [row_number for row_number, _ in rows] == [1, 3, 4]
+    assert rows[0][1] == {"text": "Q"}
+    assert isinstance(rows[1][1], ValueError)
+    assert isinstance(rows[2][1], ValueError)
+
+
+class FakeCollection:
+    """Rejects documents whose content_hash was inserted before, like the unique index"""
+
+    def __init__(self):
+        self.hashes = set()
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        self.batches.append(len(documents))
+        errors = []
+        for index, document in enumerate(documents):
+            if document["content_hash"] in self.hashes:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": "duplicate"})
+            else:
+                self.hashes.add(document["content_hash"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def build_document(record):
+    if "text" not in record:
+        raise ValueError("text is required")
+    return {"id": record["text"], "content_hash": record["text"].lower()}
+
+
+def test_import_question_rows_batches_and_reports():
+    rows = [(1, {"text": "A"}), (2, {"text": "a"}), (3, ValueError("bad json")), (4, {}), (5, {"text": "B"})]
+    collection = FakeCollection()
+    inserted = []
+
+    async def on_inserted(documents):
+        inserted.extend(document["id"] for document in documents)
+
+    report = asyncio.run(import_question_rows(iter(rows), collection, build_document, batch_size=2, on_inserted=on_inserted))
+    assert collection.batches == [2, 1]
+    assert inserted == ["A", "B"]
+    assert report.dict() == {
+        "processed": 5,
+        "inserted": 2,
+        "duplicates": 1,
+        "invalid": 2,
+        "errors": [{"row": 3, "error": "Could not parse row: bad json"}, {"row": 4, "error": "text is required"}],
+        "errors_truncated": False,
+    }
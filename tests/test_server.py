@@ -0,0 +1,245 @@
+import asyncio
+import base64
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import server
+
+
+class FakeSessions:
+    """Records bulk writes; fails with the queued exceptions first"""
+
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.writes = []
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.writes.append([(operation._filter["id"], operation._doc["$set"]) for operation in operations])
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    collection = FakeSessions()
+    monkeypatch.setattr(server, "db", SimpleNamespace(exam_sessions=collection))
+    return collection
+
+
+def test_answer_buffer_coalesces_per_session(sessions):
+    buffer = server.AnswerBuffer(flush_interval_seconds=1, max_sessions=10)
+    buffer.add("s1", "u1", {"q1": 0, "q2": 1})
+    buffer.add("s1", "u1", {"q1": 2})
+    buffer.add("s2", "u2", {"q3": 3})
+    asyncio.run(buffer.flush())
+    assert sessions.writes == [[("s1", {"answers.q1": 2, "answers.q2": 1}), ("s2", {"answers.q3": 3})]]
+    assert buffer.stats()["pending_sessions"] == 0
+
+
+def test_answer_buffer_flush_session_leaves_others_pending(sessions):
+    buffer = server.AnswerBuffer(flush_interval_seconds=1, max_sessions=10)
+    buffer.add("s1", "u1", {"q1": 0})
+    buffer.add("s2", "u2", {"q2": 1})
+    asyncio.run(buffer.flush_session("s1", "u1"))
+    assert sessions.writes == [[("s1", {"answers.q1": 0})]]
+    assert buffer.stats()["pending_sessions"] == 1
+
+
+def test_answer_buffer_requeues_under_newer_answers_on_transient_error(sessions):
+    buffer = server.AnswerBuffer(flush_interval_seconds=1, max_sessions=10)
+    sessions.failures.append(AutoReconnect("connection reset"))
+    buffer.add("s1", "u1", {"q1": 0, "q2": 1})
+    with pytest.raises(AutoReconnect):
+        asyncio.run(buffer.flush())
+    buffer.add("s1", "u1", {"q1": 3})
+    asyncio.run(buffer.flush())
+    assert sessions.writes == [[("s1", {"answers.q1": 3, "answers.q2": 1})]]
+    assert buffer.stats()["failures"] == 1
+
+
+def test_answer_buffer_drops_entries_with_write_errors(sessions):
+    buffer = server.AnswerBuffer(flush_interval_seconds=1, max_sessions=10)
+    sessions.failures.append(BulkWriteError({"writeErrors": [{"index": 0, "code": 52, "errmsg": "bad field name"}]}))
+    buffer.add("s1", "u1", {"$x": 0})
+    buffer.add("s2", "u2", {"q1": 1})
+    asyncio.run(buffer.flush())
+    asyncio.run(buffer.flush())
+    assert sessions.writes == []
+    assert buffer.stats()["pending_sessions"] == 0
+    assert buffer.stats()["dropped_sessions"] == 1
+    assert buffer.stats()["flushed_sessions"] == 1
+
+
+def make_pool():
+    pool = server.QuestionPool()
+    pool.add_many(
+        [{"id": f"m{i}", "category": "Math", "difficulty": "easy"} for i in range(5)]
+        + [{"id": f"s{i}", "category": "Science", "difficulty": "hard"} for i in range(3)]
+    )
+    return pool
+
+
+def test_question_pool_samples_distinct_ids_matching_filters():
+    pool = make_pool()
+    sampled = pool.sample(8)
+    assert sorted(sampled) == sorted([f"m{i}" for i in range(5)] + [f"s{i}" for i in range(3)])
+    assert set(pool.sample(3, category="Math")) <= {f"m{i}" for i in range(5)}
+    assert len(pool.sample(3, category="Math")) == 3
+    assert set(pool.sample(10, difficulty=server.DifficultyLevel.HARD)) == {"s0", "s1", "s2"}
+    assert pool.sample(2, category="Math", difficulty="hard") == []
+
+
+def test_question_pool_ignores_duplicates_and_forgets_removed_ids():
+    pool = make_pool()
+    pool.add({"id": "m0", "category": "Math", "difficulty": "easy"})
+    assert len(pool) == 8
+    pool.remove("s1")
+    pool.remove("missing")
+    assert len(pool) == 7
+    assert set(pool.sample(10, category="Science")) == {"s0", "s2"}
+
+
+def test_leaderboard_cursor_round_trips_and_rejects_garbage():
+    cursor = server.encode_leaderboard_cursor({"average_score": 87.5, "id": "u1", "username": "a"})
+    assert server.decode_leaderboard_cursor(cursor) == (87.5, "u1")
+    for garbage in ("not-base64!", base64.urlsafe_b64encode(b"[1]").decode(), base64.urlsafe_b64encode(b"{}").decode()):
+        with pytest.raises(HTTPException) as error:
+            server.decode_leaderboard_cursor(garbage)
+        assert error.value.status_code == 400
+
+
+def test_ranked_filters_break_ties_by_id():
+    below = server.ranked_after(80.0, "u5")
+    above = server.ranked_before(80.0, "u5")
+    assert below["total_exams"] == above["total_exams"] == {"$gt": 0}
+    assert below["$or"] == [{"average_score": {"$lt": 80.0}}, {"average_score": 80.0, "id": {"$gt": "u5"}}]
+    assert above["$or"] == [{"average_score": {"$gt": 80.0}}, {"average_score": 80.0, "id": {"$lt": "u5"}}]
+
+
+def test_category_stats_update_adds_to_existing_and_appends_new_categories():
+    assert server.category_stats_update({}) == {"$ifNull": ["$categories", []]}
+    updated, added = server.category_stats_update({"Math": [3, 2], "Art": [1, 0]})["$concatArrays"]
+    branches = updated["$map"]["in"]["$switch"]["branches"]
+    assert [branch["case"] for branch in branches] == [
+        {"$eq": ["$$entry.category", {"$literal": "Math"}]}, {"$eq": ["$$entry.category", {"$literal": "Art"}]}
+    ]
+    assert branches[0]["then"]["questions"] == {"$add": ["$$entry.questions", 3]}
+    assert branches[0]["then"]["correct"] == {"$add": ["$$entry.correct", 2]}
+    assert added["$filter"]["input"] == {"$literal": [
+        {"category": "Math", "exams": 1, "questions": 3, "correct": 2},
+        {"category": "Art", "exams": 1, "questions": 1, "correct": 0},
+    ]}
+
+
+def test_category_correct_update_shifts_only_correct_counts():
+    assert server.category_correct_update([]) == {"$ifNull": ["$categories", []]}
+    (branch,) = server.category_correct_update([["Math", -2]])["$map"]["in"]["$switch"]["branches"]
+    assert branch["then"] == {
+        "category": "$$entry.category",
+        "exams": "$$entry.exams",
+        "questions": "$$entry.questions",
+        "correct": {"$add": ["$$entry.correct", -2]},
+    }
+
+
+def test_streak_update_continues_from_yesterday_and_restarts_after_a_gap():
+    same_day, next_day = server.streak_update(datetime(2024, 5, 2, 23, 59))["$switch"]["branches"]
+    assert same_day == {"case": {"$eq": ["$last_exam_day", "2024-05-02"]}, "then": {"$ifNull": ["$current_streak", 1]}}
+    assert next_day == {
+        "case": {"$eq": ["$last_exam_day", "2024-05-01"]},
+        "then": {"$add": [{"$ifNull": ["$current_streak", 0]}, 1]},
+    }
+    assert server.streak_update(datetime(2024, 3, 1))["$switch"]["branches"][1]["case"] == {
+        "$eq": ["$last_exam_day", "2024-02-29"]
+    }
+    assert server.streak_update(datetime(2024, 5, 2))["$switch"]["default"] == 1
+
+
+class FakeRevokedTokens:
+    def __init__(self):
+        self.documents = {}
+
+    async def update_one(self, query, update, upsert=False):
+        if query["jti"] in self.documents:
+            return SimpleNamespace(upserted_id=None)
+        self.documents[query["jti"]] = update["$setOnInsert"]
+        return SimpleNamespace(upserted_id=query["jti"])
+
+    async def find(self, query, projection=None):
+        for document in list(self.documents.values()):
+            if document["expires_at"] <= query["expires_at"]["$gt"]:
+                continue
+            if "jti" in query and document["jti"] not in query["jti"]["$in"]:
+                continue
+            yield document
+
+
+@pytest.fixture
+def revoked_tokens(monkeypatch):
+    collection = FakeRevokedTokens()
+    monkeypatch.setattr(server, "db", SimpleNamespace(revoked_tokens=collection))
+    monkeypatch.setattr(server, "cache_bus", server.InvalidationBus())
+    return collection
+
+
+def claims(jti, expires_in):
+    return {"jti": jti, "sub": "u1", "exp": int(time.time()) + expires_in}
+
+
+def test_token_deny_list_revokes_once(revoked_tokens):
+    deny_list = server.TokenDenyList()
+    assert asyncio.run(deny_list.revoke(claims("t1", 60)))
+    assert not asyncio.run(deny_list.revoke(claims("t1", 60)))
+    assert revoked_tokens.documents["t1"]["user_id"] == "u1"
+
+
+def test_token_deny_list_loads_unexpired_entries(revoked_tokens):
+    publisher = server.TokenDenyList()
+    asyncio.run(publisher.revoke(claims("live", 60)))
+    asyncio.run(publisher.revoke(claims("expired", -60)))
+    deny_list = server.TokenDenyList()
+    asyncio.run(deny_list.load(["live", "expired"]))
+    assert deny_list.is_revoked("live")
+    assert not deny_list.is_revoked("expired")
+    revoked_tokens.documents.clear()
+    asyncio.run(deny_list.load())
+    assert not deny_list.is_revoked("live")
+    assert deny_list.stats() == {"size": 0}
+
+
+class FakeRollups:
+    """Fails each bulk write with the queued write errors first"""
+
+    def __init__(self, *write_errors):
+        self.write_errors = list(write_errors)
+        self.batches = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.batches.append(list(operations))
+        if self.write_errors:
+            raise BulkWriteError({"writeErrors": self.write_errors.pop(0)})
+
+
+def duplicate(index):
+    return {"index": index, "code": server.DUPLICATE_KEY_ERROR, "errmsg": "duplicate key"}
+
+
+def test_completion_rollups_retry_duplicates_once(monkeypatch):
+    rollups = FakeRollups([duplicate(1)], [duplicate(0)])
+    monkeypatch.setattr(server, "db", SimpleNamespace(user_rollups=rollups))
+    operations = server.rollup_updates("u1", "s1", "2024-05-01", 50.0, {}, {})
+    asyncio.run(server.record_completion_rollups(operations))
+    # The retry holds only the colliding upsert; a duplicate on the retry means it was counted already
+    assert rollups.batches == [operations, [operations[1]]]
+
+
+def test_completion_rollups_raise_other_write_errors(monkeypatch):
+    rollups = FakeRollups([{"index": 0, "code": 2, "errmsg": "bad value"}])
+    monkeypatch.setattr(server, "db", SimpleNamespace(user_rollups=rollups))
+    with pytest.raises(BulkWriteError):
+        asyncio.run(server.record_completion_rollups(server.rollup_updates("u1", "s1", "2024-05-01", 50.0, {}, {})))